@@ -3,7 +3,9 @@ from pydantic import BaseModel, Field
 from supabase import Client
 from typing import Dict, Any, List, Optional, Tuple
 from starlette.responses import StreamingResponse
+from starlette.background import BackgroundTask
 import json
+import orjson
 import time # For unique filename
 import uuid # For generating share IDs
 
@@ -148,10 +150,11 @@ async def download_exam_results_docx(
         raise HTTPException(status_code=400, detail="Exam data is required to generate DOCX.")
     
     try:
-        exam_data = json.loads(exam_data_json)
-        user_answers = json.loads(user_answers_json)
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError, so the handler below still applies
+        exam_data = orjson.loads(exam_data_json)
+        user_answers = orjson.loads(user_answers_json)
 
-        docx_io = await exam_simulator_service.create_docx_from_exam_results(
+        docx_file = await exam_simulator_service.create_docx_from_exam_results(
             exam_data=exam_data,
             user_answers=user_answers,
             score=score,
@@ -162,9 +165,10 @@ async def download_exam_results_docx(
         )
         file_name = f"{course_name.replace(' ', '_')}_Exam_Results_{int(time.time())}.docx"
         return StreamingResponse(
-            docx_io,
+            docx_file,
             media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={"Content-Disposition": f"attachment; filename={file_name}"}
+            headers={"Content-Disposition": f"attachment; filename={file_name}"},
+            background=BackgroundTask(docx_file.close)
         )
     except json.JSONDecodeError as e:
         print(f"JSONDecodeError in download_exam_results_docx: {e}") # Log for debugging
@@ -283,7 +287,7 @@ async def download_shared_exam_results(
             raise HTTPException(status_code=status_code, detail=download_data_response["message"])
 
         # Generate the DOCX file
-        docx_buffer = await exam_simulator_service.create_docx_from_exam_results(
+        docx_file = await exam_simulator_service.create_docx_from_exam_results(
             exam_data=download_data_response["exam_data"],
             user_answers=download_data_response["user_answers"],
             score=download_data_response["score"],
@@ -305,9 +309,10 @@ async def download_shared_exam_results(
 
         filename = f"exam_results_{share_id}_{submission_id}.docx"
         return StreamingResponse(
-            docx_buffer,
+            docx_file,
             media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+            headers={"Content-Disposition": f"attachment; filename={filename}"},
+            background=BackgroundTask(docx_file.close)
         )
 
     except HTTPException as e:
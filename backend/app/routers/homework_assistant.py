@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, s
 from supabase import Client
 from typing import Dict, Any, Optional
 from starlette.responses import StreamingResponse
+from starlette.background import BackgroundTask
 import time
 
 from app.core.database import get_supabase_client
@@ -72,13 +73,14 @@ async def download_homework_solution_docx(
         raise HTTPException(status_code=400, detail="Solution text is required to generate DOCX.")
     
     try:
-        docx_io = await homework_assistant_service.create_docx_from_solution(solution_text, context)
+        docx_file = await homework_assistant_service.create_docx_from_solution(solution_text, context)
         username = current_user["username"] if current_user else "guest"
         file_name = f"homework_solution_{username}_{int(time.time())}.docx"
         return StreamingResponse(
-            docx_io,
+            docx_file,
             media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={"Content-Disposition": f"attachment; filename={file_name}"}
+            headers={"Content-Disposition": f"attachment; filename={file_name}"},
+            background=BackgroundTask(docx_file.close)
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred during DOCX creation: {e}")
\ No newline at end of file
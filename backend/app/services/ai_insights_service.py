@@ -3,7 +3,7 @@ from typing import Dict, Any, List, Optional
 from supabase import Client
 from groq import GroqError
 
-from app.services.groq_service import get_groq_client, call_groq
+from app.services.groq_service import get_async_groq_client, acall_groq
 from app.services.usage_service import log_usage
 
 logger = logging.getLogger(__name__)
@@ -22,7 +22,7 @@ async def get_quiz_ai_insights(
     Analyzes quiz results using AI to provide insights on weak points and improvement tips.
     """
     try:
-        client, error_message = get_groq_client()
+        client, error_message = get_async_groq_client()
         if error_message:
             return {"success": False, "message": error_message}
 
@@ -73,7 +73,7 @@ Ensure your response is clear, concise, and directly addresses the student's per
 
         for model in models:
             try:
-                response = call_groq(
+                response = await acall_groq(
                     client,
                     messages=[
                         {"role": "system", "content": "You are an expert educational AI tutor analyzing quiz results."},
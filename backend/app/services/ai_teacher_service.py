@@ -1,5 +1,5 @@
 from typing import List, Dict, Any, Optional
-from app.services.groq_service import get_groq_client, call_groq
+from app.services.groq_service import get_async_groq_client, acall_groq
 from groq import GroqError
 from app.services.usage_service import log_usage
 from supabase import Client
@@ -87,7 +87,7 @@ async def generate_ai_teacher_response(
     chat_history: List[Dict[str, str]]
 ) -> Dict[str, Any]:
     
-    client, error_message = get_groq_client()
+    client, error_message = get_async_groq_client()
     if error_message:
         return {"success": False, "message": error_message}
 
@@ -107,7 +107,7 @@ async def generate_ai_teacher_response(
 
         for model in models:
             try:
-                response = call_groq(
+                response = await acall_groq(
                     client,
                     messages=messages,
                     model=model,
@@ -1,5 +1,5 @@
 from typing import Dict, Any, Optional
-from app.services.groq_service import get_groq_client, call_groq
+from app.services.groq_service import get_async_groq_client, acall_groq
 from groq import GroqError
 from app.services.usage_service import log_usage
 from supabase import Client
@@ -59,7 +59,7 @@ async def generate_course_outline(
     if not course_full_name:
         return {"success": False, "message": "Course Full Name is required."}
 
-    client, error_message = get_groq_client()
+    client, error_message = get_async_groq_client()
     if error_message:
         return {"success": False, "message": error_message}
     
@@ -92,7 +92,7 @@ async def generate_course_outline(
 
         for model in models:
             try:
-                response = call_groq(
+                response = await acall_groq(
                     client,
                     messages=messages,
                     model=model,
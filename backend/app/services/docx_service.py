@@ -0,0 +1,10 @@
+from typing import IO
+import tempfile
+
+# DOCX exports stay in memory up to this size and transparently spill to a temporary file beyond it
+DOCX_SPOOL_MAX_SIZE = 4 * 1024 * 1024
+
+
+def new_docx_buffer() -> IO[bytes]:
+    """Returns a spooled buffer for a DOCX export; close it once the response has been sent."""
+    return tempfile.SpooledTemporaryFile(max_size=DOCX_SPOOL_MAX_SIZE)
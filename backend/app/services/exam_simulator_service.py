@@ -1,52 +1,160 @@
-from typing import Dict, Any, List, Optional, Tuple
-from app.services.groq_service import get_groq_client, call_groq
+from typing import Dict, Any, List, Optional, Tuple, Set, Coroutine, IO, Iterator, Union
+from app.services.groq_service import get_async_groq_client, acall_groq
 from groq import GroqError
 from app.services.usage_service import log_usage, log_performance
+from app.services.pdf_text_service import iter_pdf_page_text
+from app.services.docx_service import new_docx_buffer
 from supabase import Client
 from postgrest.exceptions import APIError #for supabase v2
+from postgrest.types import ReturnMethod
 import json
+import orjson
 from docx import Document
+from docx.oxml.ns import qn
+from lxml import etree
 import io
 import time
 import re
+import string
 import uuid
+import secrets
 import datetime
 import logging
+import asyncio
+import functools
+import copy
+import bisect
+import hashlib
 from io import BytesIO
-from PyPDF2 import PdfReader
+from collections import OrderedDict
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
 # Configuration for chunking
 MAX_CHUNK_SIZE = 5000  # Characters per chunk for lecture notes
 CHUNK_OVERLAP = 400    # Overlap between chunks
+# Notes beyond this many characters would only be chunked and summarised away, so extraction stops there
+MAX_EXTRACTED_NOTES_CHARS = MAX_CHUNK_SIZE * 50
 
-# Helper function to extract text from file content
-async def _extract_text_from_file_content(file_content: bytes, file_name: str) -> Optional[str]:
-    """Extracts text from a file content based on its extension."""
+# Cap on chunk summaries in flight to Groq at once (across all requests in this worker) to stay under the rate limit
+MAX_CONCURRENT_CHUNK_SUMMARIES = 6
+_chunk_summary_semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHUNK_SUMMARIES)
+# Chunks summarized per Groq call; 4 x MAX_CHUNK_SIZE still fits the 8k-context fallback model
+CHUNK_SUMMARY_BATCH_SIZE = 4
+
+
+class _LRUCache:
+    """
+    Small in-process LRU cache with an optional TTL, used for the module's hot lookups.
+    Entries are (stored_at, value) pairs kept in recency order; the least recently used one is
+    evicted once max_entries is exceeded.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        """Returns the value cached for `key`, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Stores `value` under `key`, evicting the least recently used entry when full."""
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def replace(self, key: str, value: Any) -> None:
+        """Swaps the value of an existing entry but keeps its timestamp, so it expires as originally scheduled."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries[key] = (entry[0], value)
+
+
+# LRU cache of lecture-note summaries (per chunk and per whole upload), keyed by a hash of model + text.
+# Summaries of identical text never go stale, so entries are only evicted for space.
+NOTES_SUMMARY_CACHE_MAX_ENTRIES = 1024
+_notes_summary_cache = _LRUCache(NOTES_SUMMARY_CACHE_MAX_ENTRIES)
+
+# How long a successful model probe is trusted before the candidates are probed again
+MODEL_PROBE_TTL_SECONDS = 300
+_probed_model: Optional[Tuple[float, str]] = None
+
+# In-process cache of exams generated from lecture notes, keyed by a hash of the normalised request.
+# Topic-only exams are never cached, so each request for a topic still gets freshly generated questions.
+EXAM_CACHE_MAX_ENTRIES = 1024
+EXAM_CACHE_TTL_SECONDS = 3600
+_exam_cache = _LRUCache(EXAM_CACHE_MAX_ENTRIES, EXAM_CACHE_TTL_SECONDS)
+
+# Strong references to in-flight background logging tasks so they are not garbage collected
+_background_tasks: Set[asyncio.Task] = set()
+
+
+async def _log_safely(coro: Coroutine) -> None:
+    """Awaits a logging coroutine, swallowing errors so a failed log never surfaces to the user."""
+    try:
+        await coro
+    except Exception as e:
+        logger.error(f"Background logging failed: {e}", exc_info=True)
+
+
+def _log_in_background(coro: Coroutine) -> None:
+    """Schedules a usage/performance log without making the caller wait for the Supabase write."""
+    task = asyncio.create_task(_log_safely(coro))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def _extract_text_sync(file_content: bytes, file_name: str, max_chars: Optional[int] = None) -> Optional[str]:
+    """
+    Blocking PDF/DOCX/TXT text extraction; call through _extract_text_from_file_content.
+    PDF pages and DOCX paragraphs stop being read once `max_chars` characters have been collected.
+    """
     try:
         if file_name.lower().endswith('.pdf'):
-            pdf_reader = PdfReader(BytesIO(file_content))
-            text = ""
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
+            parts = []
+            total_chars = 0
+            for page_idx, page_text in enumerate(iter_pdf_page_text(file_content)):
                 if page_text:
-                    text += page_text + "\n"
+                    parts.append(page_text)
+                    total_chars += len(page_text)
+                    if max_chars is not None and total_chars >= max_chars:
+                        logger.info(f"Stopped PDF extraction of {file_name} after {page_idx + 1} pages ({total_chars} characters)")
+                        break
+            text = "\n".join(parts)
             if not text.strip():
                 return "Error: Could not extract text from PDF. The file might be image-based or corrupted."
             return text
 
         elif file_name.lower().endswith('.docx'):
             document = Document(BytesIO(file_content))
-            text = ""
+            parts = []
+            total_chars = 0
             for paragraph in document.paragraphs:
-                text += paragraph.text + "\n"
+                paragraph_text = paragraph.text
+                parts.append(paragraph_text)
+                total_chars += len(paragraph_text)
+                if max_chars is not None and total_chars >= max_chars:
+                    logger.info(f"Stopped DOCX extraction of {file_name} after {len(parts)} paragraphs ({total_chars} characters)")
+                    break
+            text = "\n".join(parts)
             if not text.strip():
                 return "Error: Could not extract text from DOCX. The file might be empty or corrupted."
             return text
 
         elif file_name.lower().endswith('.txt'):
-            return file_content.decode("utf-8")
+            return file_content.decode("utf-8", errors="replace")
         else:
             return None
     except Exception as e:
@@ -54,6 +162,36 @@ async def _extract_text_from_file_content(file_content: bytes, file_name: str) -
         return f"Error processing file {file_name}: {e}"
 
 
+# Helper function to extract text from file content
+async def _extract_text_from_file_content(file_content: bytes, file_name: str, max_chars: Optional[int] = MAX_EXTRACTED_NOTES_CHARS) -> Optional[str]:
+    """Extracts text from a file content based on its extension, parsing in a worker thread so large files don't block the event loop."""
+    return await asyncio.to_thread(_extract_text_sync, file_content, file_name, max_chars)
+
+
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+def _iter_paragraphs(text: str) -> Iterator[str]:
+    """Lazily yields the same pieces as text.split('\n\n') without building the whole list."""
+    start = 0
+    while True:
+        end = text.find('\n\n', start)
+        if end == -1:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 2
+
+
+def _iter_sentences(paragraph: str) -> Iterator[str]:
+    """Lazily yields the same pieces as _SENTENCE_SPLIT_RE.split(paragraph)."""
+    start = 0
+    for match in _SENTENCE_SPLIT_RE.finditer(paragraph):
+        yield paragraph[start:match.start()]
+        start = match.end()
+    yield paragraph[start:]
+
+
 def create_intelligent_chunks(text: str, max_chunk_size: int = MAX_CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
     """
     Splits text into chunks intelligently, respecting paragraph and sentence boundaries.
@@ -62,10 +200,10 @@ def create_intelligent_chunks(text: str, max_chunk_size: int = MAX_CHUNK_SIZE, o
         return [text]
     
     chunks = []
-    paragraphs = text.split('\n\n')
     current_chunk = ""
     
-    for paragraph in paragraphs:
+    # Paragraphs and sentences are scanned lazily so a multi-megabyte upload never exists as one big list
+    for paragraph in _iter_paragraphs(text):
         paragraph = paragraph.strip()
         if not paragraph:
             continue
@@ -76,10 +214,9 @@ def create_intelligent_chunks(text: str, max_chunk_size: int = MAX_CHUNK_SIZE, o
                 overlap_text = current_chunk[-overlap:] if len(current_chunk) > overlap else current_chunk
                 current_chunk = overlap_text + "\n\n" + paragraph
             else:
-                sentences = re.split(r'(?<=[.!?])\s+', paragraph)
                 temp_chunk = ""
                 
-                for sentence in sentences:
+                for sentence in _iter_sentences(paragraph):
                     if len(temp_chunk) + len(sentence) + 1 > max_chunk_size:
                         if temp_chunk:
                             chunks.append(temp_chunk.strip())
@@ -101,10 +238,20 @@ def create_intelligent_chunks(text: str, max_chunk_size: int = MAX_CHUNK_SIZE, o
     return chunks
 
 
+def _notes_summary_key(text: str, model: str) -> str:
+    """Hashes the text together with the model so summaries from different models don't mix."""
+    return hashlib.blake2b(f"{model}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+
+
 async def summarize_lecture_notes_chunk(chunk: str, chunk_index: int, total_chunks: int, client: Any, model: str) -> Optional[str]:
     """
     Summarizes a chunk of lecture notes to extract key concepts.
     """
+    cache_key = _notes_summary_key(chunk, model)
+    cached_summary = _notes_summary_cache.get(cache_key)
+    if cached_summary is not None:
+        return cached_summary
+
     context = f"This is part {chunk_index + 1} of {total_chunks} from lecture notes." if total_chunks > 1 else "These are complete lecture notes."
     
     system_prompt = "You are an expert at extracting key concepts from academic lecture notes."
@@ -125,19 +272,81 @@ Provide a concise summary of the most important points."""
     ]
     
     try:
-        response = call_groq(
-            client,
-            messages=messages,
-            model=model,
-            temperature=0.2
-        )
-        return response.choices[0].message.content.strip()
+        async with _chunk_summary_semaphore:
+            response = await acall_groq(
+                client,
+                messages=messages,
+                model=model,
+                temperature=0.2
+            )
+        summary = response.choices[0].message.content.strip()
+        _notes_summary_cache.set(cache_key, summary)
+        return summary
     except Exception as e:
         logger.warning(f"Failed to summarize chunk {chunk_index + 1}: {e}")
         # Return first 800 chars as fallback
         return chunk[:800] + "..."
 
 
+async def summarize_lecture_notes_batch(chunks: List[str], start_index: int, total_chunks: int, client: Any, model: str) -> List[Optional[str]]:
+    """
+    Summarizes several consecutive chunks in a single Groq call, returning one summary per chunk.
+    Falls back to summarizing each chunk on its own if the batched reply can't be used.
+    """
+    if len(chunks) == 1:
+        return [await summarize_lecture_notes_chunk(chunks[0], start_index, total_chunks, client, model)]
+
+    cache_keys = [_notes_summary_key(chunk, model) for chunk in chunks]
+    cached_summaries = [_notes_summary_cache.get(cache_key) for cache_key in cache_keys]
+    if all(summary is not None for summary in cached_summaries):
+        return cached_summaries
+
+    system_prompt = "You are an expert at extracting key concepts from academic lecture notes."
+
+    sections = "".join(
+        f"\n==={start_index + offset + 1}===\n{chunk}\n"
+        for offset, chunk in enumerate(chunks)
+    )
+    user_prompt = f"""These are parts {start_index + 1}-{start_index + len(chunks)} of {total_chunks} from lecture notes.
+
+For EACH section below, separately extract and summarize the key concepts, definitions, formulas, and important facts.
+Focus on information that would be suitable for exam questions.
+
+Return ONLY a JSON object of the form {{"summaries": ["summary of first section", ...]}} with exactly {len(chunks)} strings, in section order.
+
+Lecture notes sections:
+{sections}"""
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+    try:
+        async with _chunk_summary_semaphore:
+            response = await acall_groq(
+                client,
+                messages=messages,
+                model=model,
+                temperature=0.2,
+                response_format={"type": "json_object"}
+            )
+        summaries = orjson.loads(response.choices[0].message.content or "").get("summaries")
+        if isinstance(summaries, list) and len(summaries) == len(chunks) and all(isinstance(summary, str) for summary in summaries):
+            summaries = [summary.strip() for summary in summaries]
+            for cache_key, summary in zip(cache_keys, summaries):
+                _notes_summary_cache.set(cache_key, summary)
+            return summaries
+        logger.warning(f"Batched summary for chunks {start_index + 1}-{start_index + len(chunks)} had the wrong shape; summarizing individually")
+    except Exception as e:
+        logger.warning(f"Failed to batch-summarize chunks {start_index + 1}-{start_index + len(chunks)}: {e}")
+
+    return list(await asyncio.gather(*[
+        summarize_lecture_notes_chunk(chunk, start_index + offset, total_chunks, client, model)
+        for offset, chunk in enumerate(chunks)
+    ]))
+
+
 async def process_large_lecture_notes(lecture_notes_content: str, client: Any, model: str) -> str:
     """
     Processes large lecture notes by chunking and summarizing to fit model context.
@@ -150,24 +359,35 @@ async def process_large_lecture_notes(lecture_notes_content: str, client: Any, m
         logger.info("Lecture notes fit within size limit")
         return lecture_notes_content
     
+    # Re-uploads of the same notes (e.g. regenerating after a bad exam) reuse the earlier summary
+    notes_cache_key = _notes_summary_key(lecture_notes_content, model)
+    cached_summary = _notes_summary_cache.get(notes_cache_key)
+    if cached_summary is not None:
+        logger.info("Using cached summary for these lecture notes")
+        return cached_summary
+
     # Large notes - need to chunk and summarize
     logger.info("Lecture notes exceed limit, applying chunking")
     chunks = create_intelligent_chunks(lecture_notes_content)
     logger.info(f"Created {len(chunks)} chunks from lecture notes")
     
-    # Summarize each chunk to extract key concepts
-    chunk_summaries = []
-    for i, chunk in enumerate(chunks):
-        logger.info(f"Processing chunk {i+1}/{len(chunks)}")
-        summary = await summarize_lecture_notes_chunk(
-            chunk=chunk,
-            chunk_index=i,
+    # Summarize CHUNK_SUMMARY_BATCH_SIZE chunks per Groq call, with the batches running concurrently
+    # (bounded by _chunk_summary_semaphore), to extract key concepts
+    batch_results = await asyncio.gather(*[
+        summarize_lecture_notes_batch(
+            chunks=chunks[i:i + CHUNK_SUMMARY_BATCH_SIZE],
+            start_index=i,
             total_chunks=len(chunks),
             client=client,
             model=model
         )
-        if summary:
-            chunk_summaries.append(summary)
+        for i in range(0, len(chunks), CHUNK_SUMMARY_BATCH_SIZE)
+    ], return_exceptions=True)
+    chunk_summaries = [
+        summary
+        for batch in batch_results if not isinstance(batch, BaseException)
+        for summary in batch if summary
+    ]
     
     # Combine summaries
     combined_summary = "\n\n---\n\n".join(
@@ -175,6 +395,8 @@ async def process_large_lecture_notes(lecture_notes_content: str, client: Any, m
     )
     
     logger.info(f"Combined summary length: {len(combined_summary)} characters")
+    if len(chunk_summaries) == len(chunks):
+        _notes_summary_cache.set(notes_cache_key, combined_summary)
     return combined_summary
 
 
@@ -182,23 +404,142 @@ GRADE_POINTS = {
     "A": 5.0, "B": 4.0, "C": 3.0, "D": 2.0, "E": 1.0, "F": 0.0
 }
 
+# Answers are almost always a bare letter, so one dict lookup replaces strip()/upper() for them
+_LETTER_LUT = {letter: letter.upper() for letter in string.ascii_letters}
+
+
+def _normalize_letter(value: Optional[str]) -> str:
+    """Normalises an answer label for comparison; missing answers become an empty string."""
+    if not value:
+        return ""
+    letter = _LETTER_LUT.get(value)
+    return letter if letter is not None else value.strip().upper()
+
+
+def _answers_by_index(user_answers: Dict[str, str]) -> Dict[int, str]:
+    """Converts the JSON string-keyed answers ({"0": "A", ...}) to int keys once, skipping malformed keys."""
+    return {int(key): value for key, value in user_answers.items() if key.isdecimal()}
+
+
+def _selected_letters(user_answers: Dict[str, str], total_questions: int) -> List[str]:
+    """
+    Lays the JSON string-keyed answers ({"0": "A", ...}) out as a per-question list of normalised
+    letters in one pass over the answers given; unanswered questions stay "".
+    """
+    selected = [""] * total_questions
+    for key, value in user_answers.items():
+        # isdecimal, not isdigit: digits such as "²" pass isdigit() but make int() raise
+        if key.isdecimal():
+            idx = int(key)
+            if idx < total_questions:
+                selected[idx] = _normalize_letter(value)
+    return selected
+
+
+def _count_correct(correct_letters: Union[List[str], np.ndarray], selected_letters: List[str]) -> int:
+    """Counts answered questions whose selected letter matches the answer key, compared element-wise with numpy."""
+    # Fixed-width unicode arrays (not dtype=object) so the comparisons run in C rather than per-element Python ==;
+    # an answer key that is already such an array is used as-is
+    correct = np.asarray(correct_letters, dtype=np.str_)
+    selected = np.array(selected_letters, dtype=np.str_)
+    return int(np.count_nonzero((correct == selected) & (selected != "")))
+
+
+# Lower percentage bound of each grade band, ascending; _GRADE_BANDS[i] applies from _GRADE_THRESHOLDS[i - 1] up
+_GRADE_THRESHOLDS = (40, 45, 50, 60, 70)
+_GRADE_BANDS = (
+    ("F", "Fail. You are not ready for this exam."),
+    ("E", "Weak Pass. Dangerous territory."),
+    ("D", "Pass. You need to study more."),
+    ("C", "Credit. You passed, but barely."),
+    ("B", "Very Good. Keep it up."),
+    ("A", "Excellent! Distinction level."),
+)
+
+
+@functools.lru_cache(maxsize=4096)
 def calculate_grade(score: int, total: int) -> Tuple[str, str, float]:
     if total == 0:
         return "N/A", "No questions graded.", 0.0
     
     percentage = round((score / total) * 100, 2)
-    if percentage >= 70:
-        return "A", "Excellent! Distinction level.", percentage
-    elif percentage >= 60:
-        return "B", "Very Good. Keep it up.", percentage
-    elif percentage >= 50:
-        return "C", "Credit. You passed, but barely.", percentage
-    elif percentage >= 45:
-        return "D", "Pass. You need to study more.", percentage
-    elif percentage >= 40:
-        return "E", "Weak Pass. Dangerous territory.", percentage
-    else:
-        return "F", "Fail. You are not ready for this exam.", percentage
+    grade, remark = _GRADE_BANDS[bisect.bisect_right(_GRADE_THRESHOLDS, percentage)]
+    return grade, remark, percentage
+
+
+# Set to False once PostgREST reports the exam_percentile RPC as missing, so later calls go straight to the fallback.
+# Expected definition:
+#   create function exam_percentile(p_shared_exam_id uuid, p_score float8)
+#   returns table(better bigint, total bigint) language sql stable as $$
+#     select count(*) filter (where s.percentage_score < p_score), count(s.percentage_score)
+#     from shared_exam_submissions s where s.shared_exam_id = p_shared_exam_id
+#   $$;
+# The p_ prefixes matter: inside a SQL function a bare name like "score" resolves to the
+# shared_exam_submissions column of that name before the parameter.
+_percentile_rpc_available = True
+
+# Sorted percentage_score arrays per shared exam for the client-side fallback, so repeat comparisons
+# skip the fetch and sort. New submissions are folded into the cached array (see _add_cached_score).
+# Scores are kept as uint16 hundredths of a percent: percentages are rounded to 2 decimals when
+# graded, so this is exact for ranking and a quarter of the size of float64.
+SORTED_SCORES_CACHE_MAX_ENTRIES = 256
+SORTED_SCORES_CACHE_TTL_SECONDS = 60
+_sorted_scores_cache = _LRUCache(SORTED_SCORES_CACHE_MAX_ENTRIES, SORTED_SCORES_CACHE_TTL_SECONDS)
+
+
+def _to_hundredths(percentage: Union[float, np.ndarray]) -> Union[int, np.ndarray]:
+    """Quantises percentages (0-100, 2 decimals) to the uint16 hundredths used by the sorted scores cache."""
+    if isinstance(percentage, np.ndarray):
+        return np.rint(percentage * 100).astype(np.uint16)
+    return int(round(percentage * 100))
+
+
+def _add_cached_score(shared_exam_id: str, percentage: float) -> None:
+    """
+    Folds a new submission's score into the exam's cached sorted scores so the next comparison
+    needn't refetch them. The entry keeps its original timestamp, so submissions written by other
+    workers still show up once the TTL expires.
+    """
+    sorted_percentages = _sorted_scores_cache.get(shared_exam_id)
+    if sorted_percentages is None:
+        return
+    hundredths = _to_hundredths(percentage)
+    position = np.searchsorted(sorted_percentages, hundredths, side='left')
+    _sorted_scores_cache.replace(shared_exam_id, np.insert(sorted_percentages, position, hundredths))
+
+
+async def _count_scores_below(supabase: Client, shared_exam_id: str, score: float) -> Tuple[int, int]:
+    """
+    Returns (submissions scoring below `score`, submissions with a score) for a shared exam.
+    The counting runs in Postgres via the exam_percentile RPC so only two integers cross the wire;
+    without the RPC every percentage is fetched, sorted once and ranked with np.searchsorted.
+    """
+    global _percentile_rpc_available
+    if _percentile_rpc_available:
+        try:
+            response = await asyncio.to_thread(
+                supabase.rpc("exam_percentile", {"p_shared_exam_id": shared_exam_id, "p_score": score}).execute
+            )
+            row = response.data[0] if isinstance(response.data, list) else response.data
+            return int(row["better"]), int(row["total"])
+        except APIError as e:
+            logger.warning(f"exam_percentile RPC failed, falling back to client-side counting: {e.message}")
+            if e.code == "PGRST202":  # PostgREST: function not found
+                _percentile_rpc_available = False
+
+    sorted_percentages = _sorted_scores_cache.get(shared_exam_id)
+    if sorted_percentages is None:
+        response = await asyncio.to_thread(
+            supabase.table("shared_exam_submissions").select("percentage_score").eq("shared_exam_id", shared_exam_id).execute
+        )
+        sorted_percentages = np.sort(_to_hundredths(np.fromiter(
+            (sub['percentage_score'] for sub in response.data if sub['percentage_score'] is not None),
+            dtype=np.float64
+        )))
+        _sorted_scores_cache.set(shared_exam_id, sorted_percentages)
+    # On a sorted array the number of scores strictly below `score` is its left insertion point
+    return int(np.searchsorted(sorted_percentages, _to_hundredths(score), side='left')), int(sorted_percentages.size)
+
 
 async def get_exam_performance_comparison(
     supabase: Client,
@@ -209,30 +550,23 @@ async def get_exam_performance_comparison(
     Calculates how the current score compares to other submissions for the same exam.
     """
     try:
-        response = supabase.table("shared_exam_submissions").select("percentage_score").eq("shared_exam_id", shared_exam_id).execute()
-        
-        all_percentages = [sub['percentage_score'] for sub in response.data if sub['percentage_score'] is not None]
+        better_than_count, total_count = await _count_scores_below(supabase, shared_exam_id, current_score_percentage)
 
-        if not all_percentages:
+        if not total_count:
             return {"success": True, "comparison_message": "No other submissions yet for comparison."}
         
-        better_than_count = sum(1 for p in all_percentages if current_score_percentage > p)
+        percentile = (better_than_count / total_count) * 100
         
-        if len(all_percentages) > 0:
-            percentile = (better_than_count / len(all_percentages)) * 100
-            
-            if percentile >= 90:
-                comparison_message = f"Outstanding! You performed better than {percentile:.0f}% of test takers."
-            elif percentile >= 75:
-                comparison_message = f"Excellent! You performed better than {percentile:.0f}% of test takers."
-            elif percentile >= 50:
-                comparison_message = f"Good job! You performed better than {percentile:.0f}% of test takers."
-            else:
-                comparison_message = f"You performed better than {percentile:.0f}% of test takers. Keep studying!"
-
-            return {"success": True, "comparison_message": comparison_message, "percentile": percentile}
+        if percentile >= 90:
+            comparison_message = f"Outstanding! You performed better than {percentile:.0f}% of test takers."
+        elif percentile >= 75:
+            comparison_message = f"Excellent! You performed better than {percentile:.0f}% of test takers."
+        elif percentile >= 50:
+            comparison_message = f"Good job! You performed better than {percentile:.0f}% of test takers."
         else:
-            return {"success": True, "comparison_message": "Be the first to set the bar for this exam!"}
+            comparison_message = f"You performed better than {percentile:.0f}% of test takers. Keep studying!"
+
+        return {"success": True, "comparison_message": comparison_message, "percentile": percentile}
 
     except APIError as e:
         logger.error(f"Supabase APIError fetching exam submissions: {e.message}")
@@ -242,6 +576,16 @@ async def get_exam_performance_comparison(
         return {"success": False, "message": "An unexpected error occurred during performance comparison."}
 
 
+_REQUIRED_QUESTION_FIELDS = ('question', 'options', 'answer', 'explanation')
+# Option labels by index, so labelling an option is a tuple lookup instead of chr(65 + idx)
+_OPTION_LETTERS = tuple(string.ascii_uppercase)
+
+
+def _as_dict(question: Any) -> Dict[str, Any]:
+    """Returns the question's field mapping: the dict itself, or the object's attribute dict (writes go through to the object)."""
+    return question if isinstance(question, dict) else vars(question)
+
+
 def validate_and_fix_exam_questions(exam_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Validates and fixes exam questions to ensure proper format.
@@ -250,57 +594,51 @@ def validate_and_fix_exam_questions(exam_data: List[Dict[str, Any]]) -> List[Dic
     - Handles both dictionary and object types for questions.
     """
     fixed_exam_data = []
-    
-    # Helper function to get value safely from dict or object
-    def safe_get(item, key, default=None):
-        if isinstance(item, dict):
-            return item.get(key, default)
-        else:
-            return getattr(item, key, default)
-
-    # Helper function to set value safely on dict or object
-    def safe_set(item, key, value):
-        if isinstance(item, dict):
-            item[key] = value
-        else:
-            setattr(item, key, value)
 
     for q_idx, question in enumerate(exam_data):
         try:
-            # Ensure required fields exist using safe_get
-            # 'key in item' works for both dicts and objects if keys/attributes exist
-            if not all(safe_get(question, key) is not None for key in ['question', 'options', 'answer', 'explanation']):
+            # Normalise to a mapping once so every field access below is a plain dict operation
+            q = _as_dict(question)
+
+            # Ensure required fields exist
+            if any(q.get(key) is None for key in _REQUIRED_QUESTION_FIELDS):
                 logger.warning(f"Question {q_idx + 1} missing required fields, skipping")
                 continue
             
-            # Ensure options is a list with 4 items using safe_get
-            options_val = safe_get(question, 'options')
+            # Ensure options is a list with 4 items
+            options_val = q['options']
             if not isinstance(options_val, list) or len(options_val) != 4:
                 logger.warning(f"Question {q_idx + 1} has invalid options format, skipping")
                 continue
             
             # Fix the answer field
-            answer = safe_get(question, 'answer', '').strip()
+            answer = q['answer'].strip()
             
             # If answer is already just a letter, keep it
             if len(answer) == 1 and answer.upper() in ['A', 'B', 'C', 'D']:
-                safe_set(question, 'answer', answer.upper())
+                q['answer'] = answer.upper()
             else:
-                # AI returned the full option text instead of letter - find which option matches
-                answer_found = False
+                # AI returned the full option text instead of letter - find which option matches:
+                # an exact (case-insensitive) hit first, then a single substring pass in option order
+                answer_lower = answer.lower()
+                options_lower = {}
                 for option_idx, option_text in enumerate(options_val):
-                    if answer.lower() == option_text.lower() or answer in option_text or option_text in answer:
-                        # Use safe_set for assignment
-                        safe_set(question, 'answer', chr(65 + option_idx)) 
-                        answer_found = True
-                        # Log using safe_get to read the updated answer, handling both dict/object
-                        logger.info(f"Fixed answer for Q{q_idx + 1}: '{answer}' -> '{safe_get(question, 'answer')}'")
-                        break
-                
-                if not answer_found:
+                    options_lower.setdefault(option_text.lower(), option_idx)
+                matched_idx = options_lower.get(answer_lower)
+                if matched_idx is None:
+                    matched_idx = next(
+                        (option_idx for option_idx, option_text in enumerate(options_val)
+                         if answer in option_text or option_text in answer),
+                        None
+                    )
+
+                if matched_idx is not None:
+                    q['answer'] = _OPTION_LETTERS[matched_idx]
+                    logger.info(f"Fixed answer for Q{q_idx + 1}: '{answer}' -> '{q['answer']}'")
+                else:
                     # Default to A if we can't determine the answer
                     logger.warning(f"Could not determine answer for Q{q_idx + 1}, defaulting to 'A'")
-                    safe_set(question, 'answer', 'A')
+                    q['answer'] = 'A'
             
             fixed_exam_data.append(question)
             
@@ -311,6 +649,296 @@ def validate_and_fix_exam_questions(exam_data: List[Dict[str, Any]]) -> List[Dic
     return fixed_exam_data
 
 
+# Markdown code fences (```json / ```) the model sometimes wraps its output in
+_CODE_FENCE_RE = re.compile(r'```(?:json)?\s*')
+# The JSON array of questions, tolerating any preamble/epilogue around it
+_JSON_ARRAY_RE = re.compile(r'\[\s*\{.*\}\s*\]', re.DOTALL)
+
+def _extract_json_array(text: str) -> Any:
+    """
+    Pulls the question array out of a reply wrapped in code fences or prose.
+    The common case is a plain slice from the first '[' to the last ']', which needs no regex;
+    the fence-stripping and array regexes are only used when that slice doesn't parse.
+    """
+    start = text.find('[')
+    end = text.rfind(']')
+    if 0 <= start < end:
+        try:
+            return orjson.loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            pass
+
+    # Clean the response - remove markdown code blocks in a single pass
+    cleaned_text = _CODE_FENCE_RE.sub('', text).strip()
+
+    # Try to extract JSON if there's extra text
+    json_match = _JSON_ARRAY_RE.search(cleaned_text)
+    if json_match:
+        cleaned_text = json_match.group(0)
+    return orjson.loads(cleaned_text)
+
+
+def _parse_exam_response(response_content: str) -> Any:
+    """
+    Parses the model output into the list of questions.
+    JSON-mode output ({"questions": [...]}) is parsed directly; anything else falls back to
+    stripping code fences and extracting the bare JSON array. Raises json.JSONDecodeError if both fail
+    (orjson.JSONDecodeError subclasses it).
+    """
+    try:
+        parsed = orjson.loads(response_content)
+    except json.JSONDecodeError:
+        parsed = _extract_json_array(response_content)
+
+    if isinstance(parsed, dict) and "questions" in parsed:
+        return parsed["questions"]
+    return parsed
+
+
+# Static prompt fragments for exam generation, built once at import time.
+# Only the course/topic/notes-specific parts are formatted per request.
+_EXAM_SYSTEM_PROMPT = "You are an expert university professor setting an exam. You MUST follow the output format exactly."
+
+_EXAM_OUTPUT_FORMAT = """
+OUTPUT FORMAT (STRICT):
+Return ONLY a raw JSON object with a single key "questions" holding an array of questions. Do NOT use markdown code blocks or any other formatting.
+Each question must be a dictionary with these EXACT keys:
+- "question": The question text (string)
+- "options": Array of exactly 4 strings
+- "answer": Single letter ONLY: "A", "B", "C", or "D" (string)
+- "explanation": Why the answer is correct (string)
+"""
+
+_EXAM_LAST_INSTRUCTION = """
+LAST INSTRUCTION:
+THERE CAN ONLY BE ONE CORRECT ANSWER.
+I CAN'T STRESS THIS ENOUGH,IN ALL YOU DO ENSURE MAXIMUM ACCURACY,THE CORRECT ANSWERS YOU PROVIDE MUST BE ACCURATE AND CORRECT, MAKE SURE YOU'VE PROPERLY DEDUCED THAT THE CORRECT ANSWER IS TRULY CORRECT.
+
+"""
+
+_NOTES_PROMPT_TAIL = """
+CRITICAL INSTRUCTIONS:
+1. Questions must be based ONLY on content from the lecture notes provided by the user
+2. Each question must have exactly 4 options labeled A, B, C, D
+3. The "answer" field MUST contain ONLY the letter (A, B, C, or D) - NOT the full text of the option
+4. For mathematical questions, do NOT use LaTeX commands
+5. Include at least one complex scenario or problem-solving question
+""" + _EXAM_OUTPUT_FORMAT + """
+Example format:
+{
+  "questions": [
+    {
+        "question": "What is photosynthesis?",
+        "options": ["Process of plant respiration", "Process converting light to energy", "Process of cell division", "Process of water absorption"],
+        "answer": "B",
+        "explanation": "Photosynthesis is the process by which plants convert light energy into chemical energy."
+    }
+  ]
+}
+""" + _EXAM_LAST_INSTRUCTION
+
+_TOPIC_PROMPT_TAIL = """
+CRITICAL INSTRUCTIONS:
+1. Each question must have exactly 4 options labeled A, B, C, D
+2. The "answer" field MUST contain ONLY the letter (A, B, C, or D) - NOT the full text of the option
+3. For mathematical questions, do NOT use LaTeX commands
+4. Questions should vary in difficulty
+5. Include at least one complex scenario or problem-solving question
+""" + _EXAM_OUTPUT_FORMAT + """
+Example format:
+{
+  "questions": [
+    {
+        "question": "What is the capital of France?",
+        "options": ["London", "Paris", "Berlin", "Madrid"],
+        "answer": "B",
+        "explanation": "Paris is the capital and largest city of France."
+    }
+  ]
+}
+""" + _EXAM_LAST_INSTRUCTION
+
+# The instructions and examples go in the system message so every request shares an identical
+# prompt prefix, which the provider can serve from its prompt cache; the user message only
+# carries the request-specific course/topic/notes.
+_NOTES_SYSTEM_PROMPT = _EXAM_SYSTEM_PROMPT + "\n" + _NOTES_PROMPT_TAIL
+_TOPIC_SYSTEM_PROMPT = _EXAM_SYSTEM_PROMPT + "\n" + _TOPIC_PROMPT_TAIL
+
+
+def _exam_cache_key(course_name: str, topic: Optional[str], num_questions: int, notes_hash: Optional[str]) -> str:
+    """Builds the exam cache key; course and topic are normalised so trivially different spellings share an entry."""
+    normalized_course = " ".join(course_name.lower().split())
+    normalized_topic = " ".join(topic.lower().split()) if topic else ""
+    raw_key = f"{normalized_course}|{normalized_topic}|{num_questions}|{notes_hash or ''}"
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+# Set to False once PostgREST reports the notes_exams table as missing, so later generations skip the lookup and save.
+# Expected definition (the unique constraint is the upsert's on_conflict target):
+#   create table notes_exams (
+#     notes_hash text not null,
+#     num_questions int not null,
+#     exam_data jsonb not null,
+#     created_at timestamptz not null default now(),
+#     unique (notes_hash, num_questions)
+#   );
+_notes_exams_available = True
+
+
+def _check_notes_exams_table(e: APIError) -> None:
+    """Disables the notes_exams lookups when the error says the table doesn't exist."""
+    global _notes_exams_available
+    if e.code in ("PGRST205", "42P01"):  # PostgREST: table not in schema cache / Postgres: undefined table
+        logger.warning(f"notes_exams table not found, exams from duplicate notes will be regenerated: {e.message}")
+        _notes_exams_available = False
+
+
+async def _get_notes_exam(supabase: Client, notes_hash: str, num_questions: int) -> Optional[List[Dict[str, Any]]]:
+    """Looks up an exam previously generated from lecture notes with the same hash and question count."""
+    if not _notes_exams_available:
+        return None
+    try:
+        response = await asyncio.to_thread(
+            supabase.table("notes_exams").select("exam_data").eq("notes_hash", notes_hash).eq("num_questions", num_questions).limit(1).execute
+        )
+        if response.data:
+            return response.data[0]["exam_data"]
+    except APIError as e:
+        _check_notes_exams_table(e)
+        if _notes_exams_available:
+            logger.error(f"Supabase APIError reading notes exam {notes_hash}: {e.message}")
+    except Exception as e:
+        logger.error(f"Error reading notes exam {notes_hash}: {e}", exc_info=True)
+    return None
+
+
+async def _save_notes_exam(supabase: Client, notes_hash: str, num_questions: int, exam_data: List[Dict[str, Any]]) -> None:
+    """Stores a generated exam keyed by its lecture notes hash so duplicate uploads skip the AI call."""
+    if not _notes_exams_available:
+        return
+    try:
+        # Concurrent generations from the same notes race to store the same key; the first write wins (ON CONFLICT DO NOTHING)
+        await asyncio.to_thread(
+            supabase.table("notes_exams").upsert({
+                "notes_hash": notes_hash,
+                "num_questions": num_questions,
+                "exam_data": exam_data
+            }, on_conflict="notes_hash,num_questions", ignore_duplicates=True, returning=ReturnMethod.minimal).execute
+        )
+    except APIError as e:
+        _check_notes_exams_table(e)
+        if _notes_exams_available:
+            logger.error(f"Supabase APIError saving notes exam {notes_hash}: {e.message}")
+    except Exception as e:
+        logger.error(f"Error saving notes exam {notes_hash}: {e}", exc_info=True)
+
+
+# Candidate models in order of preference
+_EXAM_MODELS = ("llama-3.1-8b-instant", "llama3-8b-8192")
+
+
+async def _probe_working_model(client: Any) -> Optional[str]:
+    """
+    Tests which model is available. All candidates are probed concurrently, but the most preferred
+    one that answers wins; probes still in flight once it is known are cancelled.
+    A successful result is reused for MODEL_PROBE_TTL_SECONDS.
+    """
+    global _probed_model
+    if _probed_model is not None and time.monotonic() - _probed_model[0] < MODEL_PROBE_TTL_SECONDS:
+        return _probed_model[1]
+
+    probes = [
+        asyncio.create_task(acall_groq(
+            client,
+            messages=[{"role": "user", "content": "Hi"}],
+            model=model,
+            temperature=0.1
+        ))
+        for model in _EXAM_MODELS
+    ]
+    working_model = None
+    try:
+        for model, probe in zip(_EXAM_MODELS, probes):
+            try:
+                await probe
+                working_model = model
+                logger.info(f"Using model: {working_model}")
+                break
+            except Exception as e:
+                logger.warning(f"Model {model} not available: {e}")
+    finally:
+        for probe in probes:
+            probe.cancel()
+        # Reap the cancelled/failed probes so their exceptions are not reported as never retrieved
+        await asyncio.gather(*probes, return_exceptions=True)
+
+    if working_model:
+        _probed_model = (time.monotonic(), working_model)
+    return working_model
+
+
+def _uuid7() -> uuid.UUID:
+    """
+    RFC 9562 version 7 UUID: a 48-bit millisecond timestamp followed by random bits, so new
+    shared_exams ids land at the right edge of the primary key index instead of scattering.
+    """
+    value = (time.time_ns() // 1_000_000 & 0xFFFF_FFFF_FFFF) << 80 | secrets.randbits(80)
+    value = value & ~(0xF << 76) | 0x7 << 76  # version 7
+    value = value & ~(0x3 << 62) | 0x2 << 62  # RFC 4122/9562 variant
+    return uuid.UUID(int=value)
+
+
+async def _finalize_generated_exam(
+    supabase: Client,
+    user_id: str,
+    username: str,
+    course_name: str,
+    topic: Optional[str],
+    file_name: Optional[str],
+    is_sharable: bool,
+    exam_data: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Saves the exam for sharing if requested, logs usage and builds the success response."""
+    share_id = None
+
+    # Save to shared_exams if sharable
+    if is_sharable:
+        share_id = str(_uuid7())
+        try:
+            # Run the blocking insert in a worker thread so it can overlap with other writes
+            await asyncio.to_thread(
+                supabase.table("shared_exams").insert({
+                    "id": share_id,
+                    "creator_id": user_id,
+                    "title": f"{course_name} Exam ({len(exam_data)} Qs)",
+                    "exam_data": exam_data
+                }, returning=ReturnMethod.minimal).execute
+            )
+        except APIError as db_e:
+            logger.error(f"Supabase error saving shared exam: {db_e.message}")
+            share_id = None
+        except Exception as db_e:
+            logger.error(f"Exception during Supabase insertion: {db_e}", exc_info=True)
+            share_id = None
+
+    _log_in_background(log_usage(
+        supabase=supabase,
+        user_id=user_id,
+        user_name=username,
+        feature_name="Exam Simulator",
+        action="generated_exam",
+        metadata={
+            "course": course_name, 
+            "topic": topic if topic else "notes", 
+            "num_questions": len(exam_data),
+            "is_sharable": is_sharable, 
+            "source_file": file_name
+        }
+    ))
+
+    return {"success": True, "exam_data": exam_data, "share_id": share_id}
+
+
 async def generate_exam_questions(
     supabase: Client,
     user_id: str,
@@ -332,28 +960,39 @@ async def generate_exam_questions(
     if is_sharable and user_id.startswith("guest_"):
         return {"success": False, "message": "Guest users cannot create sharable exams. Please log in to use this feature."}
 
-    client, error_message = get_groq_client()
+    # Identical notes (e.g. the same course PDF uploaded by several students) reuse a previously generated exam
+    notes_hash = None
+    if lecture_notes_content:
+        notes_hash = hashlib.sha256(lecture_notes_content.encode("utf-8")).hexdigest()
+
+    cached_exam_data = None
+    if notes_hash:
+        cache_key = _exam_cache_key(course_name, topic, num_questions, notes_hash)
+        cached_exam_data = _exam_cache.get(cache_key)
+        if cached_exam_data is None:
+            cached_exam_data = await _get_notes_exam(supabase, notes_hash, num_questions)
+            if cached_exam_data:
+                _exam_cache.set(cache_key, cached_exam_data)
+    if cached_exam_data:
+        # Callers get their own copy, so nothing they do to it leaks into the cached exam
+        cached_exam_data = copy.deepcopy(cached_exam_data)
+        logger.info(f"Serving cached exam for course '{course_name}'")
+        return await _finalize_generated_exam(
+            supabase=supabase,
+            user_id=user_id,
+            username=username,
+            course_name=course_name,
+            topic=topic,
+            file_name=file_name,
+            is_sharable=is_sharable,
+            exam_data=cached_exam_data
+        )
+
+    client, error_message = get_async_groq_client()
     if error_message:
         return {"success": False, "message": error_message}
     
-    # Test which model is available
-    models = ["llama-3.1-8b-instant", "llama3-8b-8192"]
-    working_model = None
-    
-    for model in models:
-        try:
-            test_response = call_groq(
-                client,
-                messages=[{"role": "user", "content": "Hi"}],
-                model=model,
-                temperature=0.1
-            )
-            working_model = model
-            logger.info(f"Using model: {working_model}")
-            break
-        except Exception as e:
-            logger.warning(f"Model {model} not available: {e}")
-    
+    working_model = await _probe_working_model(client)
     if not working_model:
         return {"success": False, "message": "AI service is currently overloaded. Please try again."}
     
@@ -365,90 +1004,20 @@ async def generate_exam_questions(
             working_model
         )
     
-    # Construct prompt dynamically
-    system_prompt = "You are an expert university professor setting an exam. You MUST follow the output format exactly."
-    user_prompt_content = ""
-
+    # Static instructions live in the system prompt; only the request-specific parts are formatted here
     if lecture_notes_content:
-        user_prompt_content = f"""
-Generate {num_questions} examination-standard multiple-choice questions based ONLY on the provided lecture notes.
-
-Course: {course_name}
-
-Lecture Notes:
----
-{lecture_notes_content}
----
-
-CRITICAL INSTRUCTIONS:
-1. Questions must be based ONLY on content from the lecture notes above
-2. Each question must have exactly 4 options labeled A, B, C, D
-3. The "answer" field MUST contain ONLY the letter (A, B, C, or D) - NOT the full text of the option
-4. For mathematical questions, do NOT use LaTeX commands
-5. Include at least one complex scenario or problem-solving question
-
-OUTPUT FORMAT (STRICT):
-Return ONLY a raw JSON array. Do NOT use markdown code blocks or any other formatting.
-Each question must be a dictionary with these EXACT keys:
-- "question": The question text (string)
-- "options": Array of exactly 4 strings
-- "answer": Single letter ONLY: "A", "B", "C", or "D" (string)
-- "explanation": Why the answer is correct (string)
-
-Example format:
-[
-  {{
-    "question": "What is photosynthesis?",
-    "options": ["Process of plant respiration", "Process converting light to energy", "Process of cell division", "Process of water absorption"],
-    "answer": "B",
-    "explanation": "Photosynthesis is the process by which plants convert light energy into chemical energy."
-  }}
-]
-
-LAST INSTRUCTION:
-THERE CAN ONLY BE ONE CORRECT ANSWER.
-I CAN'T STRESS THIS ENOUGH,IN ALL YOU DO ENSURE MAXIMUM ACCURACY,THE CORRECT ANSWERS YOU PROVIDE MUST BE ACCURATE AND CORRECT, MAKE SURE YOU'VE PROPERLY DEDUCED THAT THE CORRECT ANSWER IS TRULY CORRECT.
-
-Now generate {num_questions} questions following this EXACT format:
-"""
+        system_prompt = _NOTES_SYSTEM_PROMPT
+        user_prompt_content = "".join((
+            f"Generate {num_questions} examination-standard multiple-choice questions based ONLY on the provided lecture notes.\n\nCourse: {course_name}\n\nLecture Notes:\n---\n",
+            lecture_notes_content,
+            f"\n---\n\nNow generate {num_questions} questions following the EXACT format described above.\n"
+        ))
     else:
-        user_prompt_content = f"""
-Generate {num_questions} examination-standard multiple-choice questions.
-
-Course: {course_name}
-Topic: {topic if topic else 'General'}
-
-CRITICAL INSTRUCTIONS:
-1. Each question must have exactly 4 options labeled A, B, C, D
-2. The "answer" field MUST contain ONLY the letter (A, B, C, or D) - NOT the full text of the option
-3. For mathematical questions, do NOT use LaTeX commands
-4. Questions should vary in difficulty
-5. Include at least one complex scenario or problem-solving question
-
-OUTPUT FORMAT (STRICT):
-Return ONLY a raw JSON array. Do NOT use markdown code blocks or any other formatting.
-Each question must be a dictionary with these EXACT keys:
-- "question": The question text (string)
-- "options": Array of exactly 4 strings
-- "answer": Single letter ONLY: "A", "B", "C", or "D" (string)
-- "explanation": Why the answer is correct (string)
-
-Example format:
-[
-  {{
-    "question": "What is the capital of France?",
-    "options": ["London", "Paris", "Berlin", "Madrid"],
-    "answer": "B",
-    "explanation": "Paris is the capital and largest city of France."
-  }}
-]
-
-LAST INSTRUCTION:
-THERE CAN ONLY BE ONE CORRECT ANSWER.
-I CAN'T STRESS THIS ENOUGH,IN ALL YOU DO ENSURE MAXIMUM ACCURACY,THE CORRECT ANSWERS YOU PROVIDE MUST BE ACCURATE AND CORRECT, MAKE SURE YOU'VE PROPERLY DEDUCED THAT THE CORRECT ANSWER IS TRULY CORRECT.
-
-Now generate {num_questions} questions following this EXACT format:
-"""
+        system_prompt = _TOPIC_SYSTEM_PROMPT
+        user_prompt_content = (
+            f"Generate {num_questions} examination-standard multiple-choice questions.\n\nCourse: {course_name}\nTopic: {topic if topic else 'General'}\n\n"
+            f"Now generate {num_questions} questions following the EXACT format described above.\n"
+        )
     
     messages = [
         {"role": "system", "content": system_prompt},
@@ -456,37 +1025,26 @@ Now generate {num_questions} questions following this EXACT format:
     ]
 
     generated_exam_data = None
-    share_id = None
+    response_content = ""
 
     try:
-        response = call_groq(
+        # JSON mode makes Groq return a syntactically valid JSON object, so no markdown cleanup is needed
+        response = await acall_groq(
             client,
             messages=messages,
             model=working_model,
-            temperature=0.4
+            temperature=0.4,
+            response_format={"type": "json_object"}
         )
         
-        response_content = response.choices[0].message.content.strip()
+        # Read the message content once; it is None when the model returns nothing
+        response_content = (response.choices[0].message.content or "").strip()
         
         if not response_content:
             logger.error("Groq API returned an empty response.")
             return {"success": False, "message": "AI returned an empty response. Please try again."}
 
-        # Clean the response - remove markdown code blocks
-        cleaned_text = response_content
-        
-        # Remove markdown code blocks
-        cleaned_text = re.sub(r'```json\s*', '', cleaned_text)
-        cleaned_text = re.sub(r'```\s*', '', cleaned_text)
-        cleaned_text = cleaned_text.strip()
-        
-        # Try to extract JSON if there's extra text
-        json_match = re.search(r'\[\s*\{.*\}\s*\]', cleaned_text, re.DOTALL)
-        if json_match:
-            cleaned_text = json_match.group(0)
-        
-        # Parse JSON
-        generated_exam_data = json.loads(cleaned_text)
+        generated_exam_data = _parse_exam_response(response_content)
         
         # Validate it's a list
         if not isinstance(generated_exam_data, list):
@@ -502,44 +1060,31 @@ Now generate {num_questions} questions following this EXACT format:
         
         logger.info(f"Successfully generated {len(generated_exam_data)} valid questions")
 
-        # Save to shared_exams if sharable
-        if is_sharable:
-            share_id = str(uuid.uuid4())
-            try:
-                supabase.table("shared_exams").insert({
-                    "id": share_id,
-                    "creator_id": user_id,
-                    "title": f"{course_name} Exam ({len(generated_exam_data)} Qs)",
-                    "exam_data": generated_exam_data
-                }).execute()
-                
-            except APIError as db_e:
-                logger.error(f"Supabase error saving shared exam: {db_e.message}")
-                share_id = None
-            except Exception as db_e:
-                logger.error(f"Exception during Supabase insertion: {db_e}", exc_info=True)
-                share_id = None
-
-        await log_usage(
+        finalize = _finalize_generated_exam(
             supabase=supabase,
             user_id=user_id,
-            user_name=username,
-            feature_name="Exam Simulator",
-            action="generated_exam",
-            metadata={
-                "course": course_name, 
-                "topic": topic if topic else "notes", 
-                "num_questions": len(generated_exam_data),
-                "is_sharable": is_sharable, 
-                "source_file": file_name
-            }
+            username=username,
+            course_name=course_name,
+            topic=topic,
+            file_name=file_name,
+            is_sharable=is_sharable,
+            exam_data=generated_exam_data
         )
+        if not notes_hash:
+            return await finalize
 
-        return {"success": True, "exam_data": generated_exam_data, "share_id": share_id}
+        _exam_cache.set(cache_key, copy.deepcopy(generated_exam_data))
+
+        # The shared_exams and notes_exams writes are independent; issue them concurrently
+        result, _ = await asyncio.gather(
+            finalize,
+            _save_notes_exam(supabase, notes_hash, num_questions, generated_exam_data)
+        )
+        return result
 
     except json.JSONDecodeError as e:
         logger.error(f"JSON Decode Error: {e}")
-        logger.error(f"Response content: {response_content if response_content else 'No content'}")
+        logger.error(f"Response content: {response_content or 'No content'}")
         return {"success": False, "message": "AI generated an invalid exam format. Please try generating again."}
     except GroqError as e:
         msg = str(e)
@@ -563,37 +1108,19 @@ async def grade_exam_and_log_performance(
     lecture_notes_source: bool = False
 ) -> Dict[str, Any]:
 
-    score = 0
     total_questions = len(exam_data)
 
-    for idx, q in enumerate(exam_data):
-        user_selected_label = user_answers.get(str(idx))
-
-        # ✅ SAFE extraction for dict OR object
-        if isinstance(q, dict):
-            correct_answer_letter = q.get("answer")
-        else:
-            correct_answer_letter = getattr(q, "answer", None)
-
-        if not user_selected_label or not correct_answer_letter:
-            continue
-
-        user_selected_label = user_selected_label.strip().upper()
-        correct_answer_letter = correct_answer_letter.strip().upper()
-
-        if user_selected_label == correct_answer_letter:
-            score += 1
-            logger.debug(
-                f"Q{idx}: Correct | User={user_selected_label} | Answer={correct_answer_letter}"
-            )
-        else:
-            logger.debug(
-                f"Q{idx}: Wrong | User={user_selected_label} | Answer={correct_answer_letter}"
-            )
+    # ✅ SAFE extraction for dict OR object (the router passes ExamQuestion models)
+    if exam_data and isinstance(exam_data[0], dict):
+        correct_letters = [_normalize_letter(q.get("answer")) for q in exam_data]
+    else:
+        correct_letters = [_normalize_letter(getattr(q, "answer", None)) for q in exam_data]
+    selected_letters = _selected_letters(user_answers, total_questions)
+    score = _count_correct(correct_letters, selected_letters)
 
     grade, remark, percentage = calculate_grade(score, total_questions)
 
-    await log_performance(
+    _log_in_background(log_performance(
         supabase=supabase,
         user_id=user_id,
         feature="Exam Simulator",
@@ -605,9 +1132,9 @@ async def grade_exam_and_log_performance(
             "topic": topic if topic else ("notes" if lecture_notes_source else "general"),
             "percentage": percentage
         }
-    )
+    ))
 
-    await log_usage(
+    _log_in_background(log_usage(
         supabase=supabase,
         user_id=user_id,
         user_name=username,
@@ -620,7 +1147,7 @@ async def grade_exam_and_log_performance(
             "used_notes": lecture_notes_source,
             "percentage": percentage
         }
-    )
+    ))
 
     return {
         "success": True,
@@ -632,18 +1159,84 @@ async def grade_exam_and_log_performance(
     }
 
 
+_DOCX_SEPARATOR = "-" * 20
 
-async def create_docx_from_exam_results(
+
+def _clean_exam(exam_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Normalises every question for the DOCX export in a single pass: option lines are
+    pre-formatted and the explanation is collapsed to its non-empty lines.
+    """
+    cleaned = []
+    for q in exam_data:
+        explanation_lines = [
+            line for line in (raw_line.strip() for raw_line in (q.get('explanation') or 'No explanation provided.').split('\n'))
+            if line
+        ]
+        cleaned.append({
+            "question": q['question'],
+            "option_lines": [
+                f"  {_OPTION_LETTERS[opt_idx]}. {option}"
+                for opt_idx, option in enumerate(q['options'])
+            ],
+            "answer": q.get('answer', 'N/A').upper(),
+            # Keep a multi-line explanation in a single <w:p>; python-docx turns "\n" into <w:br/> runs
+            "explanation": "\n".join(explanation_lines)
+        })
+    return cleaned
+
+
+# WordprocessingML tags for the per-question paragraphs, which are built with lxml directly
+_W_P, _W_PPR, _W_PSTYLE, _W_VAL = qn('w:p'), qn('w:pPr'), qn('w:pStyle'), qn('w:val')
+_W_R, _W_T, _W_BR, _W_TAB = qn('w:r'), qn('w:t'), qn('w:br'), qn('w:tab')
+_XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+_RUN_BREAK_RE = re.compile(r'([\r\n\t])')
+
+
+def _append_paragraph(body: Any, text: str, style_id: Optional[str] = None) -> None:
+    """
+    Appends a <w:p> to `body` with the same XML python-docx's add_paragraph would produce
+    ("\n" and "\r" each as <w:br/>, "\t" as <w:tab/>), minus its per-call proxy objects and style lookups.
+    """
+    paragraph = etree.SubElement(body, _W_P)
+    if style_id:
+        etree.SubElement(etree.SubElement(paragraph, _W_PPR), _W_PSTYLE).set(_W_VAL, style_id)
+    if not text:
+        return
+    run = etree.SubElement(paragraph, _W_R)
+    for piece in _RUN_BREAK_RE.split(text):
+        if piece == "\n" or piece == "\r":
+            etree.SubElement(run, _W_BR)
+        elif piece == "\t":
+            etree.SubElement(run, _W_TAB)
+        elif piece:
+            text_element = etree.SubElement(run, _W_T)
+            text_element.text = piece
+            if piece[0].isspace() or piece[-1].isspace():
+                text_element.set(_XML_SPACE, "preserve")
+
+
+def _build_exam_results_docx(
     exam_data: List[Dict[str, Any]],
     user_answers: Dict[str, str],
     score: int,
     total_questions: int,
     grade: str,
     course_name: str,
-    topic: Optional[str] = None,
-    lecture_notes_source: bool = False
-) -> io.BytesIO:
+    topic: Optional[str],
+    lecture_notes_source: bool,
+    out: IO[bytes]
+) -> None:
+    """
+    Blocking build of the exam results document, saved into `out` and rewound. python-docx supplies
+    the styled shell and header; the per-question paragraphs are appended as raw lxml elements.
+    """
     doc = Document()
+    # Resolve the repeated paragraph styles once rather than by name on every paragraph
+    heading_style_id = doc.styles['Heading 2'].style_id
+    bullet_style_id = doc.styles['List Bullet'].style_id
+    result_style_id = doc.styles['Intense Quote'].style_id
+
     doc.add_heading(f"Exam Results: {course_name}", 0)
     
     if lecture_notes_source and topic:
@@ -652,57 +1245,169 @@ async def create_docx_from_exam_results(
         doc.add_paragraph(f"Topic: {topic}")
 
     doc.add_paragraph(f"Final Score: {score}/{total_questions}\nGrade: {grade}")
-    doc.add_paragraph("-" * 20)
-
-    for idx, q in enumerate(exam_data):
-        doc.add_heading(f"Question {idx + 1}", level=2)
-        doc.add_paragraph(q['question'])
+    doc.add_paragraph(_DOCX_SEPARATOR)
+
+    body = doc.element.body
+    section_properties = body.sectPr
+    answers_by_index = _answers_by_index(user_answers)
+    for idx, q in enumerate(_clean_exam(exam_data)):
+        _append_paragraph(body, f"Question {idx + 1}", heading_style_id)
+        _append_paragraph(body, q['question'])
         
-        doc.add_paragraph("Options:")
-        for opt_idx, option in enumerate(q['options']):
-            option_letter = chr(65 + opt_idx)
-            doc.add_paragraph(f"  {option_letter}. {option}", style='List Bullet')
+        _append_paragraph(body, "Options:")
+        for option_line in q['option_lines']:
+            _append_paragraph(body, option_line, bullet_style_id)
         
-        user_answer_letter = user_answers.get(str(idx), "N/A").upper()
-        correct_answer_letter = q.get('answer', 'N/A').upper()
+        user_answer_letter = answers_by_index.get(idx, "N/A").upper()
+        correct_answer_letter = q['answer']
         
-        doc.add_paragraph(f"Your Answer: {user_answer_letter}")
-        doc.add_paragraph(f"Correct Answer: {correct_answer_letter}")
+        _append_paragraph(body, f"Your Answer: {user_answer_letter}")
+        _append_paragraph(body, f"Correct Answer: {correct_answer_letter}")
         
         if user_answer_letter == correct_answer_letter:
-            doc.add_paragraph("Result: ✓ Correct", style='Intense Quote')
+            _append_paragraph(body, "Result: ✓ Correct", result_style_id)
         else:
-            doc.add_paragraph("Result: ✗ Incorrect", style='Intense Quote')
+            _append_paragraph(body, "Result: ✗ Incorrect", result_style_id)
         
-        doc.add_paragraph(f"Explanation: {q.get('explanation', 'No explanation provided.')}")
-        doc.add_paragraph("-" * 20)
+        _append_paragraph(body, "Explanation: " + q['explanation'])
+        _append_paragraph(body, _DOCX_SEPARATOR)
+
+    # The section properties must stay the body's last child
+    if section_properties is not None:
+        body.append(section_properties)
+
+    doc.save(out)
+    out.seek(0)
 
-    doc_io = io.BytesIO()
-    doc.save(doc_io)
-    doc_io.seek(0)
+
+async def create_docx_from_exam_results(
+    exam_data: List[Dict[str, Any]],
+    user_answers: Dict[str, str],
+    score: int,
+    total_questions: int,
+    grade: str,
+    course_name: str,
+    topic: Optional[str] = None,
+    lecture_notes_source: bool = False,
+    out: Optional[IO[bytes]] = None
+) -> IO[bytes]:
+    """
+    Builds the exam results DOCX in a worker thread so large exams don't block the event loop.
+    Writes into `out` when given, otherwise into a new buffer from new_docx_buffer(), and returns
+    that buffer rewound to the start.
+    """
+    doc_io = out if out is not None else new_docx_buffer()
+    # The python-docx tree only lives inside the worker call, so it is freed as soon as the file is saved
+    await asyncio.to_thread(
+        _build_exam_results_docx,
+        exam_data, user_answers, score, total_questions, grade,
+        course_name, topic, lecture_notes_source, doc_io
+    )
     return doc_io
 
 
+# Set to False once PostgREST reports no shared_exams.creator_id -> profiles relationship (PGRST200),
+# so later calls go straight to the separate profiles lookup.
+_creator_embed_available = True
+
+
+async def _get_shared_exam_with_creator(supabase: Client, share_id: str) -> Tuple[Dict[str, Any], str]:
+    """
+    Returns a shared exam row and its creator's username. The profile is embedded through the
+    shared_exams.creator_id -> profiles.id FK when the schema has it, and fetched separately otherwise.
+    """
+    global _creator_embed_available
+    if _creator_embed_available:
+        try:
+            response = await asyncio.to_thread(
+                supabase.table("shared_exams").select("*, profiles!creator_id(username)").eq("id", share_id).single().execute
+            )
+            creator_profile = response.data.get("profiles") or {}
+            return response.data, creator_profile.get("username") or "A user"
+        except APIError as e:
+            if e.code != "PGRST200":  # PostgREST: relationship not found
+                raise
+            logger.warning(f"shared_exams -> profiles relationship not found, fetching creators separately: {e.message}")
+            _creator_embed_available = False
+
+    response = await asyncio.to_thread(
+        supabase.table("shared_exams").select("*").eq("id", share_id).single().execute
+    )
+    creator_username = "A user"
+    if response.data.get("creator_id"):
+        try:
+            profile_response = await asyncio.to_thread(
+                supabase.table("profiles").select("username").eq("id", response.data["creator_id"]).single().execute
+            )
+            if profile_response.data:
+                creator_username = profile_response.data.get("username", "A user")
+        except APIError:
+            pass
+    return response.data, creator_username
+
+
 async def get_shared_exam(supabase: Client, share_id: str) -> Dict[str, Any]:
     """Fetches a shared exam and its creator's username."""
     try:
-        response = supabase.table("shared_exams").select("*").eq("id", share_id).single().execute()
-        
-        creator_username = "A user"
-        if response.data.get("creator_id"):
-            try:
-                profile_response = supabase.table("profiles").select("username").eq("id", response.data["creator_id"]).single().execute()
-                if profile_response.data:
-                    creator_username = profile_response.data.get("username", "A user")
-            except APIError:
-                pass
-        
+        exam_row, creator_username = await _get_shared_exam_with_creator(supabase, share_id)
+        # Warm the row cache so the submit that follows taking the exam skips its own lookup
+        _shared_exam_cache.set(share_id, {"exam_data": exam_row["exam_data"], "title": exam_row.get("title")})
+
         return {
             "success": True, 
-            "exam_data": response.data["exam_data"], 
+            "exam_data": exam_row["exam_data"], 
             "creator_username": creator_username
         }
             
+    except APIError as e:
+        if e.code == "PGRST116":  # PostgREST: .single() matched no rows
+            logger.warning(f"Shared exam {share_id} not found.")
+            return {"success": False, "message": "Exam not found or unavailable."}
+        # Anything else (e.g. a schema problem with the query) is a server fault, not a missing exam
+        logger.error(f"Supabase APIError fetching shared exam {share_id}: {e.code} {e.message}")
+        return {"success": False, "message": "A server error occurred while fetching the exam."}
+    except Exception as e:
+        logger.error(f"Error fetching shared exam {share_id}: {e}", exc_info=True)
+        return {"success": False, "message": "A server error occurred while fetching the exam."}
+
+
+# Shared exams are never edited after creation, so their questions and title can be served from
+# memory; the TTL only bounds how long a deleted exam stays reachable
+SHARED_EXAM_CACHE_MAX_ENTRIES = 512
+SHARED_EXAM_CACHE_TTL_SECONDS = 300
+_shared_exam_cache = _LRUCache(SHARED_EXAM_CACHE_MAX_ENTRIES, SHARED_EXAM_CACHE_TTL_SECONDS)
+
+
+async def _get_shared_exam_row(supabase: Client, share_id: str) -> Optional[Dict[str, Any]]:
+    """Returns a shared exam's exam_data and title, hitting Supabase only on a cache miss."""
+    row = _shared_exam_cache.get(share_id)
+    if row is not None:
+        return row
+    response = await asyncio.to_thread(
+        supabase.table("shared_exams").select("exam_data, title").eq("id", share_id).single().execute
+    )
+    if not response.data:
+        return None
+    row = {"exam_data": response.data["exam_data"], "title": response.data.get("title")}
+    _shared_exam_cache.set(share_id, row)
+    return row
+
+
+async def _get_shared_exam_answer_key(supabase: Client, share_id: str) -> Dict[str, Any]:
+    """
+    Returns a shared exam's normalised answer letters, which is all grading needs.
+    The key is derived once per cached exam row, so repeat submits skip both the
+    Supabase fetch and re-normalising every question's answer.
+    """
+    try:
+        row = await _get_shared_exam_row(supabase, share_id)
+        if row is None:
+            return {"success": False, "message": "Exam not found or unavailable."}
+        answer_key = row.get("answer_key")
+        if answer_key is None:
+            answer_key = np.array([_normalize_letter(q['answer']) for q in row["exam_data"]], dtype=np.str_)
+            row["answer_key"] = answer_key
+        return {"success": True, "answer_key": answer_key}
     except APIError as e:
         logger.error(f"Supabase APIError fetching shared exam {share_id}: {e.message}")
         return {"success": False, "message": "Exam not found or unavailable."}
@@ -711,6 +1416,39 @@ async def get_shared_exam(supabase: Client, share_id: str) -> Dict[str, Any]:
         return {"success": False, "message": "A server error occurred while fetching the exam."}
 
 
+# Parse the course and topic back out of a shared exam title for the DOCX header
+_TITLE_COURSE_RE = re.compile(r"Course: (.*?)(?: - Topic:|$)")
+_TITLE_TOPIC_RE = re.compile(r"Topic: (.*?)(?: Exam|$)")
+
+
+# Set to False once PostgREST reports no shared_exam_submissions.shared_exam_id -> shared_exams
+# relationship (PGRST200), so downloads go straight to separate submission and exam selects.
+_submission_exam_embed_available = True
+
+
+async def _get_submission_row(supabase: Client, submission_id: str, shared_exam_id: str, embed_exam: bool) -> Any:
+    """
+    Selects a submission scoped to its shared exam. With `embed_exam` the exam's questions and title
+    are embedded via the shared_exam_id FK, unless the schema lacks that relationship.
+    """
+    global _submission_exam_embed_available
+    if embed_exam and _submission_exam_embed_available:
+        try:
+            return await asyncio.to_thread(
+                supabase.table("shared_exam_submissions").select("*, shared_exams(exam_data, title)")
+                .eq("id", submission_id).eq("shared_exam_id", shared_exam_id).single().execute
+            )
+        except APIError as e:
+            if e.code != "PGRST200":  # PostgREST: relationship not found
+                raise
+            logger.warning(f"shared_exam_submissions -> shared_exams relationship not found, fetching exams separately: {e.message}")
+            _submission_exam_embed_available = False
+    return await asyncio.to_thread(
+        supabase.table("shared_exam_submissions").select("*")
+        .eq("id", submission_id).eq("shared_exam_id", shared_exam_id).single().execute
+    )
+
+
 async def get_shared_exam_submission_for_download(
     supabase: Client,
     user_id: str,
@@ -721,7 +1459,12 @@ async def get_shared_exam_submission_for_download(
     Fetches a specific shared exam submission for download.
     """
     try:
-        submission_response = supabase.table("shared_exam_submissions").select("*").eq("id", submission_id).single().execute()
+        # One round-trip: when the exam isn't cached its questions and title are embedded in the
+        # submission query via the shared_exam_id FK instead of being fetched separately
+        shared_exam = _shared_exam_cache.get(shared_exam_id)
+        submission_response = await _get_submission_row(
+            supabase, submission_id, shared_exam_id, embed_exam=shared_exam is None
+        )
         
         if not submission_response.data:
             logger.warning(f"Submission {submission_id} not found.")
@@ -733,20 +1476,23 @@ async def get_shared_exam_submission_for_download(
             logger.warning(f"Unauthorized download attempt for submission {submission_id}")
             return {"success": False, "message": "Unauthorized access to submission."}
 
-        exam_fetch_response = await get_shared_exam(supabase, shared_exam_id)
-        if not exam_fetch_response["success"]:
-            return {"success": False, "message": exam_fetch_response.get("message", "Shared exam not found.")}
-        
-        shared_exam_title_response = supabase.table("shared_exams").select("title").eq("id", shared_exam_id).single().execute()
-        if not shared_exam_title_response.data:
-            logger.warning(f"Shared exam {shared_exam_id} title not found.")
-            return {"success": False, "message": "Shared exam title not found."}
+        if shared_exam is None and "shared_exams" in submission:
+            embedded_exam = submission["shared_exams"]
+            if embedded_exam:
+                shared_exam = {"exam_data": embedded_exam["exam_data"], "title": embedded_exam.get("title")}
+                _shared_exam_cache.set(shared_exam_id, shared_exam)
+        elif shared_exam is None:
+            # The embed is unavailable in this schema; look the exam up on its own
+            shared_exam = await _get_shared_exam_row(supabase, shared_exam_id)
+        if not shared_exam:
+            logger.warning(f"Shared exam {shared_exam_id} not found.")
+            return {"success": False, "message": "Shared exam not found."}
 
-        exam_data = exam_fetch_response["exam_data"]
-        course_name_and_topic = shared_exam_title_response.data.get("title", "Unknown Exam Topic")
+        exam_data = shared_exam["exam_data"]
+        course_name_and_topic = shared_exam.get("title") or "Unknown Exam Topic"
 
-        course_name_match = re.search(r"Course: (.*?)(?: - Topic:|$)", course_name_and_topic)
-        topic_match = re.search(r"Topic: (.*?)(?: Exam|$)", course_name_and_topic)
+        course_name_match = _TITLE_COURSE_RE.search(course_name_and_topic)
+        topic_match = _TITLE_TOPIC_RE.search(course_name_and_topic)
 
         course_name = course_name_match.group(1).strip() if course_name_match else course_name_and_topic
         topic = topic_match.group(1).strip() if topic_match else None
@@ -779,21 +1525,16 @@ async def submit_shared_exam_results(
 ) -> Dict[str, Any]:
     """Grades and saves a submission for a shared exam."""
     try:
-        exam_response = await get_shared_exam(supabase, share_id)
+        exam_response = await _get_shared_exam_answer_key(supabase, share_id)
         if not exam_response["success"]:
             return exam_response
 
-        exam_data = exam_response["exam_data"]
-        total_questions = len(exam_data)
+        answer_key = exam_response["answer_key"]
+        total_questions = len(answer_key)
         
-        # Grade the submission using fixed logic
-        score = 0
-        for idx, q in enumerate(exam_data):
-            user_selected_label = user_answers.get(str(idx), "").strip().upper()
-            correct_answer_letter = q['answer'].strip().upper()
-
-            if user_selected_label == correct_answer_letter:
-                score += 1
+        # Grade the submission against the cached answer key, comparing both sides as arrays
+        selected_letters = _selected_letters(user_answers, total_questions)
+        score = _count_correct(answer_key, selected_letters)
         
         grade, remark, percentage = calculate_grade(score, total_questions)
 
@@ -806,11 +1547,15 @@ async def submit_shared_exam_results(
             "total_questions": total_questions,
             "percentage_score": percentage,
             "grade": grade,
-            "submitted_at": datetime.datetime.utcnow().isoformat() + "Z"
+            "submitted_at": datetime.datetime.now(datetime.timezone.utc).isoformat()
         }
         
         try:
-            insert_response = supabase.table("shared_exam_submissions").insert(submission_data).execute()
+            insert_response = await asyncio.to_thread(
+                supabase.table("shared_exam_submissions").insert(submission_data).execute
+            )
+            # The new score must show up in the comparison that follows this submission
+            _add_cached_score(share_id, percentage)
             
             return {
                 "success": True, 
@@ -2,44 +2,81 @@
 # Streamlit-specific UI/session state code is removed, but core API interaction and validation are preserved.
 
 import os
+import math
 import time
-from typing import Dict, Optional, Tuple, Any
-from google import genai
-from google.genai.errors import APIError # Corrected import
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, Any
+
+# google-genai is heavy and only the Gemini-backed features use it, so it is imported on first use
+if TYPE_CHECKING:
+    from google import genai
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# In-memory store for rate limiting.
-_rate_limit_history: Dict[str, list] = {}
+# In-memory token buckets for rate limiting: user -> (tokens left, time of last refill).
+# Each user can burst MAX_REQUESTS calls, refilled at MAX_REQUESTS per TIME_WINDOW_SECONDS.
+_rate_limit_buckets: Dict[str, Tuple[float, float]] = {}
 MAX_REQUESTS = 6
 TIME_WINDOW_SECONDS = 60
+_REFILL_PER_SECOND = MAX_REQUESTS / TIME_WINDOW_SECONDS
+# Buckets idle for a whole window are full again and are swept out at most this often to bound memory.
+_RATE_LIMIT_SWEEP_INTERVAL_SECONDS = 300
+_last_rate_limit_sweep = 0.0
 DEFAULT_MODEL = "gemini-2.5-flash"
 
+# One genai.Client per process so requests share its HTTP transport instead of rebuilding it.
+# Keyed on the API key, so a rotated GEMINI_API_KEY gets a fresh client.
+_gemini_client: Optional[Tuple[str, "genai.Client"]] = None
+# httpx options for the client's transports: HTTP/2 multiplexes concurrent Gemini calls over one
+# TLS connection, and the pool keeps connections open between requests. Needs the h2 package.
+GEMINI_MAX_CONNECTIONS = 20
+GEMINI_KEEPALIVE_EXPIRY_SECONDS = 60
+
 def check_rate_limit(user_identifier: str) -> Tuple[bool, str]:
     """
     Checks if a user has exceeded the rate limit.
     Returns a tuple of (is_ok, message).
     """
-    history = _rate_limit_history.get(user_identifier, [])
+    global _last_rate_limit_sweep
     current_time = time.time()
+
+    if current_time - _last_rate_limit_sweep > _RATE_LIMIT_SWEEP_INTERVAL_SECONDS:
+        _last_rate_limit_sweep = current_time
+        idle_since = current_time - TIME_WINDOW_SECONDS
+        for idle_user in [user for user, (_, last) in _rate_limit_buckets.items() if last <= idle_since]:
+            del _rate_limit_buckets[idle_user]
+
+    # Runs on the event loop without awaiting, so the read-modify-write below needs no lock
+    tokens, last_refill = _rate_limit_buckets.get(user_identifier, (MAX_REQUESTS, current_time))
+    tokens = min(MAX_REQUESTS, tokens + (current_time - last_refill) * _REFILL_PER_SECOND)
     
-    # Filter out timestamps older than the time window
-    history = [t for t in history if t > current_time - TIME_WINDOW_SECONDS]
-    
-    if len(history) >= MAX_REQUESTS:
-        time_to_wait = int(TIME_WINDOW_SECONDS - (current_time - history[0]))
+    if tokens < 1:
+        time_to_wait = math.ceil((1 - tokens) / _REFILL_PER_SECOND)
         message = f"Rate Limit Hit! Please wait {time_to_wait} seconds before making another request."
-        _rate_limit_history[user_identifier] = history
+        _rate_limit_buckets[user_identifier] = (tokens, current_time)
         return False, message
 
-    history.append(current_time)
-    _rate_limit_history[user_identifier] = history 
+    _rate_limit_buckets[user_identifier] = (tokens - 1, current_time)
     
     return True, "OK"
 
-async def get_gemini_client(user_id: str) -> Tuple[Optional[genai.Client], Optional[str]]:
+def _gemini_http_options() -> "genai.types.HttpOptions":
+    """HTTP/2 pooled transport settings shared by the client's sync and async httpx clients."""
+    import httpx
+    from google.genai import types
+
+    transport_args = {
+        "http2": True,
+        "limits": httpx.Limits(
+            max_connections=GEMINI_MAX_CONNECTIONS,
+            max_keepalive_connections=GEMINI_MAX_CONNECTIONS,
+            keepalive_expiry=GEMINI_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    }
+    return types.HttpOptions(client_args=transport_args, async_client_args=transport_args)
+
+async def get_gemini_client(user_id: str) -> Tuple[Optional["genai.Client"], Optional[str]]:
     """
     Handles API key selection, validation, and rate-limiting.
     Returns a configured genai.Client instance and an error message if any.
@@ -54,11 +91,16 @@ async def get_gemini_client(user_id: str) -> Tuple[Optional[genai.Client], Optio
     is_ok, message = check_rate_limit(user_id)
     if not is_ok:
         return None, message
+
+    from google import genai
+    from google.genai.errors import APIError # Corrected import
             
     try:
-        # Initialize the genai.Client instance.
-        client = genai.Client(api_key=system_api_key)
-        return client, None # Success: client, error
+        # Initialize the genai.Client instance once and reuse it.
+        global _gemini_client
+        if _gemini_client is None or _gemini_client[0] != system_api_key:
+            _gemini_client = (system_api_key, genai.Client(api_key=system_api_key, http_options=_gemini_http_options()))
+        return _gemini_client[1], None # Success: client, error
     except APIError:
         # If there's any API error (e.g. quota, wrong key), return a standardized message.
         return None, "The feature is currently unavailable. In the meantime, you can try other non-ai features."
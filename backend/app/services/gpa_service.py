@@ -1,16 +1,52 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import numpy as np
 
 GRADE_POINTS = {
     "A": 5.0, "B": 4.0, "C": 3.0, "D": 2.0, "E": 1.0, "F": 0.0
 }
 
+# A-F map linearly onto 5.0-0.0, so a grade's points are 5 minus its offset from "A"
+_GRADE_A_ORDINAL = ord("A")
+_MAX_GRADE_POINTS = GRADE_POINTS["A"]
+
+# Below this many courses the plain loop is faster than building arrays
+VECTORIZE_MIN_COURSES = 100
+
 class CourseInput:
     def __init__(self, name: str, grade: str, units: int):
         self.name = name
         self.grade = grade
         self.units = units
 
+def _calculate_gpa_vectorized(courses: List[Dict[str, Any]]) -> Optional[float]:
+    """
+    NumPy version of the GPA loop for long course lists (e.g. a cumulative GPA).
+    Returns None if any course is invalid, so the caller's loop can raise the precise error.
+    """
+    grades = np.array([course_data.get('grade', 'A') for course_data in courses], dtype=np.str_)
+    units = np.array([course_data.get('units', 0) for course_data in courses])
+
+    # Every grade must be a single character (a 4-byte U1 array) to be valid; view them as code points
+    if grades.dtype.itemsize != 4:
+        return None
+    offsets = grades.view(np.uint32).astype(np.int64) - _GRADE_A_ORDINAL
+    # Units must be positive ints; floats and mixed types give a different dtype kind
+    if ((offsets < 0) | (offsets >= len(GRADE_POINTS))).any() or units.dtype.kind != 'i' or (units <= 0).any():
+        return None
+
+    points = _MAX_GRADE_POINTS - offsets
+    total_units = int(units.sum())
+    if total_units > 0:
+        gpa = float((points * units).sum()) / total_units
+        return round(gpa, 2)
+    return 0.0
+
 async def calculate_gpa_service(courses: List[Dict[str, Any]]) -> float:
+    if len(courses) >= VECTORIZE_MIN_COURSES:
+        gpa = _calculate_gpa_vectorized(courses)
+        if gpa is not None:
+            return gpa
+
     total_units = 0
     total_grade_points = 0
     
@@ -21,12 +57,12 @@ async def calculate_gpa_service(courses: List[Dict[str, Any]]) -> float:
         units = course_data.get('units', 0)
 
         # Ensure grade and units are valid
-        if grade not in GRADE_POINTS:
+        points = GRADE_POINTS.get(grade)
+        if points is None:
             raise ValueError(f"Invalid grade provided: {grade}")
         if not isinstance(units, int) or units <= 0:
             raise ValueError(f"Invalid units provided for course {name}: {units}")
 
-        points = GRADE_POINTS[grade]
         total_units += units
         total_grade_points += (points * units)
 
@@ -1,36 +1,90 @@
-from groq import Groq
+from groq import Groq, AsyncGroq
 import os
 from tenacity import retry, stop_after_attempt, wait_exponential
 from groq import GroqError
 import logging
+from typing import Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# One client per process so every call reuses its HTTP connection pool (keep-alive, TLS sessions).
+# Keyed on the API key, so a rotated GROQ_API_KEY gets a fresh client.
+_groq_client: Optional[Tuple[str, Groq]] = None
+_async_groq_client: Optional[Tuple[str, AsyncGroq]] = None
+
 def get_groq_client():
+    global _groq_client
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        logger.error("GROQ_API_KEY environment variable not set.")
+        return None, "AI service not configured: GROQ_API_KEY is missing."
+
+    if _groq_client is None or _groq_client[0] != api_key:
+        _groq_client = (api_key, Groq(
+            api_key=api_key,
+            timeout=20,
+            max_retries=0  # call_groq/acall_groq retry with tenacity; SDK retries would multiply attempts
+        ))
+    return _groq_client[1], None
+
+def get_async_groq_client():
+    """Same as get_groq_client, but returns an AsyncGroq client for use with acall_groq."""
+    global _async_groq_client
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         logger.error("GROQ_API_KEY environment variable not set.")
         return None, "AI service not configured: GROQ_API_KEY is missing."
 
-    return Groq(
-        api_key=api_key,
-        timeout=20
-    ), None
+    if _async_groq_client is None or _async_groq_client[0] != api_key:
+        _async_groq_client = (api_key, AsyncGroq(
+            api_key=api_key,
+            timeout=20,
+            max_retries=0  # call_groq/acall_groq retry with tenacity; SDK retries would multiply attempts
+        ))
+    return _async_groq_client[1], None
 
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(), # Corrected from wait_after_attempt(1)
     reraise=True
 )
-def call_groq(client: Groq, messages: list, model: str, temperature: float = 0.4):
+def call_groq(client: Groq, messages: list, model: str, temperature: float = 0.4, response_format: Optional[dict] = None):
     """
     Wrapper for Groq API call with retry logic.
+    Pass response_format={"type": "json_object"} to enable Groq's JSON mode.
     """
     try:
+        extra_args = {"response_format": response_format} if response_format else {}
         response = client.chat.completions.create(
             model=model,
             messages=messages,
-            temperature=temperature
+            temperature=temperature,
+            **extra_args
+        )
+        return response
+    except GroqError as e:
+        logger.error(f"Groq API call failed for model {model}: {e}")
+        raise # Re-raise to be caught by tenacity
+    except Exception as e:
+        logger.error(f"An unexpected error occurred during Groq API call for model {model}: {e}")
+        raise
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(),
+    reraise=True
+)
+async def acall_groq(client: AsyncGroq, messages: list, model: str, temperature: float = 0.4, response_format: Optional[dict] = None):
+    """
+    Async counterpart of call_groq: awaits the request on the event loop instead of blocking a thread.
+    """
+    try:
+        extra_args = {"response_format": response_format} if response_format else {}
+        response = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            **extra_args
         )
         return response
     except GroqError as e:
@@ -38,4 +92,4 @@ def call_groq(client: Groq, messages: list, model: str, temperature: float = 0.4
         raise # Re-raise to be caught by tenacity
     except Exception as e:
         logger.error(f"An unexpected error occurred during Groq API call for model {model}: {e}")
-        raise
\ No newline at end of file
+        raise
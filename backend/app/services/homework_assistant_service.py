@@ -1,14 +1,118 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, IO, Tuple
 from app.services.gemini_service import get_gemini_client
-from google import genai
 from app.services.usage_service import log_usage
+from app.services.docx_service import new_docx_buffer
 from supabase import Client
 from docx import Document
 from docx.shared import Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 import io
 import re # Import re for regex operations
-from PIL import Image # Import PIL Image as in original utils.py
+import asyncio
+import logging
+from enum import Enum
+
+logger = logging.getLogger(__name__)
+
+# Cap on homework requests in flight to Gemini at once (across all users in this worker), so a burst
+# queues here instead of tripping the per-minute request limit and failing with 429s
+MAX_CONCURRENT_GEMINI_REQUESTS = 4
+_gemini_semaphore = asyncio.Semaphore(MAX_CONCURRENT_GEMINI_REQUESTS)
+
+# Magic-number prefixes of the image formats Gemini accepts, for uploads sent without a usable content type
+_IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+def _resolve_image_mime_type(image_content: bytes, declared_mime_type: Optional[str]) -> Optional[str]:
+    """Returns the upload's image MIME type, sniffing the header bytes when none was declared."""
+    if declared_mime_type and declared_mime_type.startswith("image/"):
+        return declared_mime_type
+    if image_content[:4] == b"RIFF" and image_content[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, mime_type in _IMAGE_SIGNATURES:
+        if image_content.startswith(signature):
+            return mime_type
+    return None
+
+
+# Longest side sent to Gemini; larger photos are downscaled, which cuts upload time and image tokens
+GEMINI_IMAGE_MAX_SIDE = 1568
+GEMINI_IMAGE_JPEG_QUALITY = 85
+
+
+def _downscale_image(image_content: bytes, mime_type: str) -> Tuple[bytes, str]:
+    """
+    Re-encodes images whose longest side exceeds GEMINI_IMAGE_MAX_SIDE as a smaller JPEG.
+    Images within the limit (and anything PIL can't read) are returned untouched without a full decode.
+    """
+    from PIL import Image, ImageOps  # Only needed for oversized uploads
+
+    try:
+        with Image.open(io.BytesIO(image_content)) as image:  # Reads the header only
+            if max(image.size) <= GEMINI_IMAGE_MAX_SIDE:
+                return image_content, mime_type
+            # JPEGs can be decoded straight at a reduced scale, skipping most of the full-size bitmap
+            image.draft("RGB", (GEMINI_IMAGE_MAX_SIDE, GEMINI_IMAGE_MAX_SIDE))
+            # Phone photos are often rotated via EXIF, which the re-encoded JPEG would lose
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+                # JPEG has no alpha: flatten onto white, or transparent areas (e.g. a PNG screenshot) turn black
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.thumbnail((GEMINI_IMAGE_MAX_SIDE, GEMINI_IMAGE_MAX_SIDE), Image.LANCZOS)
+            out = io.BytesIO()
+            image.save(out, format="JPEG", quality=GEMINI_IMAGE_JPEG_QUALITY, optimize=True)
+            return out.getvalue(), "image/jpeg"
+    except Exception as e:
+        logger.warning(f"Could not downscale homework image, sending the original: {e}")
+        return image_content, mime_type
+
+
+# Gemini HTTP statuses that mean "busy, retry later" rather than a problem with the request
+_GEMINI_HIGH_TRAFFIC_CODES = {
+    429: "Gemini API rate limit exceeded",
+    503: "Gemini API overloaded",
+}
+
+# Solver prompt; the no-instructions variant (most requests) is formatted once at import
+_SOLVER_PROMPT_TEMPLATE = """
+    You are a rigorous academic solver. Based on the image and the user's instructions (if any),
+    provide a complete and accurate solution. The output must be in a clean, professional, and easily 
+    readable **Markdown format**. DO NOT USE LaTex COMMANDS
+
+    Instructions:
+    {instructions}
+    """
+_SOLVER_PROMPT_NO_CONTEXT = _SOLVER_PROMPT_TEMPLATE.format(instructions="The user provided no instructions")
+
+
+# Markdown patterns, compiled once at import; the DOCX export applies them to every line of a solution
+# Bold, italic, strikethrough, links and inline code in one alternation; exactly one text group matches
+_INLINE_MARKUP_RE = re.compile(r'(\*\*|__)(.*?)\1|(\*|_)(.*?)\3|~~(.*?)~~|\[(.*?)\]\(.*?\)|`([^`]+)`')
+# Inline math $...$, LaTeX commands like \frac, and the brace groups after them, all dropped in one pass
+_MATH_MARKUP_RE = re.compile(r'\$.*?\$|\\[a-zA-Z]+|\{[^}]*\}')
+_DOLLAR_TABLE = str.maketrans('', '', '$')
+_TABLE_ROW_RE = re.compile(r'\|.*\|')
+_TABLE_SEPARATOR_RE = re.compile(r'[-=]+\s*[-=]+\s*[-=]+')
+_HEADER_RE = re.compile(r'^(#+)\s*(.*)')
+_HORIZONTAL_RULE_RE = re.compile(r'^(?:-{3,}|\*{3,})$')
+_LIST_ITEM_RE = re.compile(r'^(\*|-|\+)\s')
+_BLOCKQUOTE_RE = re.compile(r'^>\s*')
+
+
+def _unwrap_inline_markup(match: re.Match) -> str:
+    # The inner text may itself be marked up (**bold *italic***), so it is cleaned recursively
+    inner = next(group for group in match.group(2, 4, 5, 6, 7) if group is not None)
+    return _INLINE_MARKUP_RE.sub(_unwrap_inline_markup, inner)
 
 
 # Helper function to clean markdown text for docx
@@ -16,27 +120,17 @@ def _clean_markdown_text_for_docx(text_content: str) -> str:
     # Replace HTML <br> with newline
     text_content = text_content.replace('<br>', '\n')
     
-    # Remove bold, italic, and strikethrough markers
-    text_content = re.sub(r'(\*\*|__)(.*?)\1', r'\2', text_content) # **bold** or __bold__
-    text_content = re.sub(r'(\*|_)(.*?)\1', r'\2', text_content)   # *italic* or _italic_
-    text_content = re.sub(r'~~(.*?)~~', r'\1', text_content)       # ~~strikethrough~~
-
-    # Remove links [text](url) -> text
-    text_content = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text_content)
-
-    # Remove inline code blocks `code`
-    text_content = re.sub(r'`([^`]+)`', r'\1', text_content)
+    # Remove bold, italic, strikethrough, link and inline code markup, keeping the inner text
+    text_content = _INLINE_MARKUP_RE.sub(_unwrap_inline_markup, text_content)
 
     # More aggressive cleanup for math environments for simpler display if not rendering
-    text_content = re.sub(r'\$.*?\$', '', text_content) # Remove inline math $...$
-    text_content = re.sub(r'\\[a-zA-Z]+', '', text_content) # Remove LaTeX commands like \frac, \sqrt
-    text_content = re.sub(r'\{.*?\}', '', text_content) # Remove content in curly braces after LaTeX commands
-    text_content = text_content.replace('$', '') # Catch any remaining lone $
+    text_content = _MATH_MARKUP_RE.sub('', text_content)
+    text_content = text_content.translate(_DOLLAR_TABLE) # Catch any remaining lone $
 
     # Handle Markdown tables: simply strip pipes and header separators
     # This will turn tables into continuous lines of text, which is a compromise for simplicity
-    text_content = re.sub(r'\|.*\|', lambda m: m.group(0).replace('|', ' '), text_content) # Replace pipes with spaces
-    text_content = re.sub(r'[-=]+\s*[-=]+\s*[-=]+', '', text_content) # Remove table header separators (---)
+    text_content = _TABLE_ROW_RE.sub(lambda m: m.group(0).replace('|', ' '), text_content) # Replace pipes with spaces
+    text_content = _TABLE_SEPARATOR_RE.sub('', text_content) # Remove table header separators (---)
     
     # Remove block code fences ```
     text_content = text_content.replace('```', '')
@@ -49,37 +143,37 @@ async def generate_homework_solution(
     user_id: str,
     username: str,
     image_content: bytes, # Passed as bytes from FastAPI UploadFile
-    image_mime_type: str, # mime_type is needed by PIL to identify the image format
+    image_mime_type: Optional[str], # Sent to Gemini with the raw bytes; sniffed from them when missing
     context: Optional[str] = None
 ) -> Dict[str, Any]:
     
     client, error_message = await get_gemini_client(user_id=user_id)
     if error_message:
         return {"success": False, "message": error_message}
+
+    # Imported here rather than at module level so workers don't load google-genai until it's needed
+    from google import genai
+    from google.genai import types
     
-    try:
-        pil_image = Image.open(io.BytesIO(image_content))
-    except Exception as e:
-        return {"success": False, "message": f"Could not open image file: {e}"}
+    # The raw upload goes to Gemini as-is unless it is oversized; only then is it decoded and shrunk
+    mime_type = _resolve_image_mime_type(image_content, image_mime_type)
+    if not image_content or mime_type is None:
+        return {"success": False, "message": "Could not open image file: unsupported or empty image."}
+    image_content, mime_type = await asyncio.to_thread(_downscale_image, image_content, mime_type)
     
-    full_prompt = f"""
-    You are a rigorous academic solver. Based on the image and the user's instructions (if any),
-    provide a complete and accurate solution. The output must be in a clean, professional, and easily 
-    readable **Markdown format**. DO NOT USE LaTex COMMANDS
-
-    Instructions:
-    {context if context else "The user provided no instructions"}
-    """
+    full_prompt = _SOLVER_PROMPT_TEMPLATE.format(instructions=context) if context else _SOLVER_PROMPT_NO_CONTEXT
     
-    # Contents list is [PIL Image, prompt_text] as in the original Streamlit code
-    contents = [pil_image, full_prompt]
+    # Contents list is [image, prompt_text] as in the original Streamlit code
+    contents = [types.Part.from_bytes(data=image_content, mime_type=mime_type), full_prompt]
 
     try:
-        # Calling client.models.generate_content exactly as in the original utils.py and feature page
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=contents
-        )
+        # Same generate_content call as the original utils.py, through the SDK's async surface (client.aio)
+        # so the request doesn't block the event loop while Gemini works
+        async with _gemini_semaphore:
+            response = await client.aio.models.generate_content(
+                model="gemini-2.5-flash",
+                contents=contents
+            )
         
         solution_text = response.text
 
@@ -95,61 +189,111 @@ async def generate_homework_solution(
         return {"success": True, "solution_text": solution_text}
 
     except genai.errors.APIError as e:
-        error_message = str(e)
-        if "429" in error_message or "RESOURCE_EXHAUSTED" in error_message.upper():
-            print(f"Gemini API rate limit exceeded during summarization: {e}")
-            return {"success": False, "message": "AI is currently experiencing high traffic. Please try again shortly."}
-        elif "503" in error_message:
-            print(f"AI is currently eperiencing high traffic. Try again shortly.")
+        # APIError carries the HTTP status as .code, so there is no need to search its message text
+        high_traffic_reason = _GEMINI_HIGH_TRAFFIC_CODES.get(e.code)
+        if high_traffic_reason:
+            print(f"{high_traffic_reason} during homework solution generation: {e}")
             return {"success": False, "message": "AI is currently experiencing high traffic. Please try again shortly."}
         else:
             print(f"An API error occurred: {e}")
-            return "", f"An API error occurred: {e}"
+            return {"success": False, "message": f"An API error occurred: {e}"}
 
     except Exception as e:
         print(f"Error during homework solution generation: {e}")
         return {"success": False, "message": "An unexpected error occurred while generating the solution."}
 
-async def create_docx_from_solution(solution_text: str, context: Optional[str] = None) -> io.BytesIO:
-    doc = Document()
-    doc.add_heading("Homework Solution", 0)
-    if context:
-        doc.add_heading(f"Instructions: {context}", 1)
-    
-    for line in solution_text.split('\n'):
-        stripped_line = line.strip()
+class _BlockKind(Enum):
+    """Kinds of solution block produced by _parse_solution_blocks."""
+    BLANK = "blank"
+    HEADING = "heading"
+    RULE = "rule"
+    BULLET = "bullet"
+    QUOTE = "quote"
+    TEXT = "text"
 
-        if not stripped_line: # Skip empty lines
-            doc.add_paragraph("") # Add an empty paragraph for line breaks
+
+def _parse_solution_blocks(solution_text: str) -> List[Tuple[_BlockKind, str, int]]:
+    """
+    Single forward pass over the markdown solution, turning each line into a (kind, text, level) block
+    with its markdown already cleaned, so the DOCX emit loop does no parsing of its own.
+    `level` is the heading level (1-9) for HEADING blocks and 0 otherwise.
+    """
+    blocks = []
+    append = blocks.append
+    text_length = len(solution_text)
+    start = 0
+    while start <= text_length:
+        end = solution_text.find('\n', start)
+        if end == -1:
+            end = text_length
+        stripped_line = solution_text[start:end].strip()
+        start = end + 1
+
+        if not stripped_line: # Empty lines become empty paragraphs for line breaks
+            append((_BlockKind.BLANK, "", 0))
             continue
-        
+
         # Handle Headers (more robustly)
-        header_match = re.match(r'^(#+)\s*(.*)', stripped_line)
+        header_match = _HEADER_RE.match(stripped_line)
         if header_match:
-            level = len(header_match.group(1))
-            text_content = header_match.group(2).strip()
-            doc.add_heading(_clean_markdown_text_for_docx(text_content), level=min(level, 9)) # Max heading level in docx is 9
+            level = min(len(header_match.group(1)), 9) # Max heading level in docx is 9
+            append((_BlockKind.HEADING, _clean_markdown_text_for_docx(header_match.group(2).strip()), level))
         # Handle Horizontal Rule
-        elif re.match(r'^-{3,}$', stripped_line) or re.match(r'^\*{3,}$', stripped_line):
-            doc.add_paragraph("-" * 20, style='Normal') # Add a simple line for HR
-            doc.paragraphs[-1].alignment = WD_ALIGN_PARAGRAPH.CENTER
+        elif _HORIZONTAL_RULE_RE.match(stripped_line):
+            append((_BlockKind.RULE, "-" * 20, 0)) # Add a simple line for HR
         # Handle List Items
-        elif re.match(r'^(\*|-|\+)\s', stripped_line):
-            text_content = re.sub(r'^(\*|-|\+)\s', '', stripped_line).strip()
-            doc.add_paragraph(_clean_markdown_text_for_docx(text_content), style='List Bullet')
+        elif _LIST_ITEM_RE.match(stripped_line):
+            text_content = _LIST_ITEM_RE.sub('', stripped_line).strip()
+            append((_BlockKind.BULLET, _clean_markdown_text_for_docx(text_content), 0))
         # Handle Blockquotes (simple paragraph with special formatting)
         elif stripped_line.startswith('>'):
-            text_content = re.sub(r'^>\s*', '', stripped_line).strip()
-            paragraph = doc.add_paragraph()
-            run = paragraph.add_run(_clean_markdown_text_for_docx(text_content))
-            run.italic = True # Simple blockquote style
+            text_content = _BLOCKQUOTE_RE.sub('', stripped_line).strip()
+            append((_BlockKind.QUOTE, _clean_markdown_text_for_docx(text_content), 0))
         else:
             # All other content as normal paragraph
             text_content = _clean_markdown_text_for_docx(stripped_line)
             if text_content:
-                doc.add_paragraph(text_content)
+                append((_BlockKind.TEXT, text_content, 0))
+    return blocks
 
-    doc_io = io.BytesIO()
-    doc.save(doc_io)
-    doc_io.seek(0)
+
+def _build_solution_docx(solution_text: str, context: Optional[str], out: IO[bytes]) -> None:
+    """Blocking python-docx build of the solution document, saved into `out` and rewound."""
+    doc = Document()
+    doc.add_heading("Homework Solution", 0)
+    if context:
+        doc.add_heading(f"Instructions: {context}", 1)
+    
+    # Bind the Document methods once; they are called for every block of the solution
+    add_paragraph = doc.add_paragraph
+    add_heading = doc.add_heading
+    for kind, text_content, level in _parse_solution_blocks(solution_text):
+        if kind == _BlockKind.TEXT or kind == _BlockKind.BLANK:
+            add_paragraph(text_content)
+        elif kind == _BlockKind.HEADING:
+            add_heading(text_content, level=level)
+        elif kind == _BlockKind.BULLET:
+            add_paragraph(text_content, style='List Bullet')
+        elif kind == _BlockKind.QUOTE:
+            add_paragraph().add_run(text_content).italic = True # Simple blockquote style
+        elif kind == _BlockKind.RULE:
+            # Align the returned paragraph; doc.paragraphs would rebuild the list of every paragraph so far
+            add_paragraph(text_content, style='Normal').alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    doc.save(out)
+    out.seek(0)
+
+
+async def create_docx_from_solution(
+    solution_text: str,
+    context: Optional[str] = None,
+    out: Optional[IO[bytes]] = None
+) -> IO[bytes]:
+    """
+    Builds the solution DOCX in a worker thread so long solutions don't block the event loop.
+    Writes into `out` when given, otherwise into a new buffer from new_docx_buffer(), and returns
+    that buffer rewound to the start.
+    """
+    doc_io = out if out is not None else new_docx_buffer()
+    await asyncio.to_thread(_build_solution_docx, solution_text, context, doc_io)
     return doc_io
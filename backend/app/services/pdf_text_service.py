@@ -0,0 +1,36 @@
+from io import BytesIO
+from typing import Iterator
+from pypdf import PdfReader
+
+try:
+    import fitz  # PyMuPDF: much faster text extraction than pypdf
+except ImportError:
+    fitz = None
+
+# A PDF with no text on its first pages is treated as scanned/image-based and not read further
+PDF_TEXT_PROBE_PAGES = 5
+
+
+def _iter_raw_page_text(file_content: bytes) -> Iterator[str]:
+    """Yields the text of each PDF page, using PyMuPDF when installed and pypdf otherwise."""
+    if fitz is not None:
+        with fitz.open(stream=file_content, filetype="pdf") as pdf_doc:
+            for page in pdf_doc:
+                yield page.get_text("text")
+    else:
+        for page in PdfReader(BytesIO(file_content)).pages:
+            yield page.extract_text()
+
+
+def iter_pdf_page_text(file_content: bytes) -> Iterator[str]:
+    """
+    Yields the text of each PDF page (possibly empty) for the summarizer and exam simulator uploads.
+    Stops after PDF_TEXT_PROBE_PAGES pages if none of them had text, so scanned PDFs aren't read in full.
+    """
+    found_text = False
+    for page_idx, page_text in enumerate(_iter_raw_page_text(file_content)):
+        if page_text:
+            found_text = True
+        elif not found_text and page_idx + 1 >= PDF_TEXT_PROBE_PAGES:
+            return
+        yield page_text
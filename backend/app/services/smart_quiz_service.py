@@ -1,4 +1,5 @@
 import json
+import orjson
 import uuid
 import io
 import re
@@ -7,26 +8,37 @@ import datetime
 from typing import Dict, Any, List, Optional, Tuple
 from supabase import Client
 from postgrest.exceptions import APIError
-from app.services.groq_service import get_groq_client, call_groq
+from app.services.groq_service import get_async_groq_client, acall_groq
 from groq import GroqError
 from app.services.usage_service import log_usage, log_performance
 from docx import Document
 
 logger = logging.getLogger(__name__)
 
+# Compiled once at import; the DOCX export runs these over every question and explanation
+_BOLD_RE = re.compile(r'(\*\*|__)(.*?)\1')
+_ITALIC_RE = re.compile(r'(\*|_)(.*?)\1')
+_STRIKE_RE = re.compile(r'~~(.*?)~~')
+_LINK_RE = re.compile(r'\[(.*?)\]\(.*?\)')
+_INLINE_CODE_RE = re.compile(r'`([^`]+)`')
+_LATEX_COMMAND_RE = re.compile(r'\\[a-zA-Z]+')
+_BRACE_GROUP_RE = re.compile(r'\{[^}]*\}')
+_TABLE_ROW_RE = re.compile(r'\|.*\|')
+_RULE_RE = re.compile(r'[-=]+\s*[-=]+\s*[-=]+')
+
 def _clean_markdown_text_for_docx(text_content: str) -> str:
     text_content = text_content.replace('<br>', '\n')
-    text_content = re.sub(r'(\*\*|__)(.*?)\1', r'\2', text_content)
-    text_content = re.sub(r'(\*|_)(.*?)\1', r'\2', text_content)
-    text_content = re.sub(r'~~(.*?)~~', r'\1', text_content)
-    text_content = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text_content)
-    text_content = re.sub(r'`([^`]+)`', r'\1', text_content)
-    text_content = re.sub(r'\[a-zA-Z]+\{.*?\}', '', text_content)
-    text_content = re.sub(r'\[a-zA-Z]+', '', text_content)
-    text_content = re.sub(r'\{.*?\}', '', text_content)
+    text_content = _BOLD_RE.sub(r'\2', text_content)
+    text_content = _ITALIC_RE.sub(r'\2', text_content)
+    text_content = _STRIKE_RE.sub(r'\1', text_content)
+    text_content = _LINK_RE.sub(r'\1', text_content)
+    text_content = _INLINE_CODE_RE.sub(r'\1', text_content)
+    # LaTeX commands (\frac, \sqrt) go first, then the brace groups they left behind
+    text_content = _LATEX_COMMAND_RE.sub('', text_content)
+    text_content = _BRACE_GROUP_RE.sub('', text_content)
     text_content = text_content.replace('$', '')
-    text_content = re.sub(r'\|.*\|', lambda m: m.group(0).replace('|', ' '), text_content)
-    text_content = re.sub(r'[-=]+\s*[-=]+\s*[-=]+', '', text_content)
+    text_content = _TABLE_ROW_RE.sub(lambda m: m.group(0).replace('|', ' '), text_content)
+    text_content = _RULE_RE.sub('', text_content)
     text_content = text_content.replace('```', '')
     return text_content.strip()
 
@@ -90,7 +102,7 @@ async def generate_quiz_service(
     if is_sharable and user_id.startswith("guest_"):
         return {"success": False, "message": "Guest users cannot create sharable quizzes. Please log in."}
 
-    client, error_message = get_groq_client()
+    client, error_message = get_async_groq_client()
     if error_message:
         return {"success": False, "message": error_message}
 
@@ -183,7 +195,7 @@ Now generate {num_questions} {quiz_type.upper()} questions following this EXACT
 
         for model in models:
             try:
-                response = call_groq(
+                response = await acall_groq(
                     client,
                     messages=[
                         {"role": "system", "content": system_prompt},
@@ -209,7 +221,8 @@ Now generate {num_questions} {quiz_type.upper()} questions following this EXACT
         if json_match:
             cleaned_text = json_match.group(0)
 
-        generated_quiz_data = json.loads(cleaned_text)
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError, so the handler below still applies
+        generated_quiz_data = orjson.loads(cleaned_text)
 
         if not isinstance(generated_quiz_data, list):
             logger.error(f"Generated quiz data is not a list: {type(generated_quiz_data)}")
@@ -1,12 +1,13 @@
 from io import BytesIO
 from typing import Optional, Tuple, Any, List
-from pypdf import PdfReader
 from docx import Document
-from app.services.groq_service import get_groq_client, call_groq
+from app.services.groq_service import get_async_groq_client, acall_groq
+from app.services.pdf_text_service import iter_pdf_page_text
 from groq import GroqError
 import os
 import json
 import logging
+import asyncio
 
 logger = logging.getLogger(__name__)
 
@@ -15,23 +16,19 @@ MAX_CHUNK_SIZE = 6000  # Characters per chunk (conservative for 8k context model
 CHUNK_OVERLAP = 500    # Overlap between chunks to maintain context
 
 
-async def extract_text_from_file_content(file_content: bytes, file_name: str) -> Optional[str]:
-    """Extracts text from a file content based on its extension, adapted for backend."""
+def _extract_text_sync(file_content: bytes, file_name: str) -> Optional[str]:
+    """Blocking text extraction; call through extract_text_from_file_content."""
     if file_name.lower().endswith('.pdf'):
-        pdf_reader = PdfReader(BytesIO(file_content))
-        text = ""
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:  # Ensure text is not None
-                text += page_text + "\n"
-        return text
+        # Collect pages and join once instead of growing one string page by page
+        parts = []
+        for page_text in iter_pdf_page_text(file_content):
+            if page_text:  # extract_text() can return None/empty
+                parts.append(page_text)
+        return "\n".join(parts)
 
     elif file_name.lower().endswith('.docx'):
         document = Document(BytesIO(file_content))
-        text = ""
-        for paragraph in document.paragraphs:
-            text += paragraph.text + "\n"
-        return text
+        return "\n".join(paragraph.text for paragraph in document.paragraphs)
 
     elif file_name.lower().endswith('.txt'):
         return file_content.decode("utf-8")
@@ -40,6 +37,14 @@ async def extract_text_from_file_content(file_content: bytes, file_name: str) ->
         return None
 
 
+async def extract_text_from_file_content(file_content: bytes, file_name: str) -> Optional[str]:
+    """
+    Extracts text from a file content based on its extension, adapted for backend.
+    Parsing runs in a worker thread so a large PDF doesn't stall other requests.
+    """
+    return await asyncio.to_thread(_extract_text_sync, file_content, file_name)
+
+
 def create_intelligent_chunks(text: str, max_chunk_size: int = MAX_CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
     """
     Splits text into chunks intelligently, respecting paragraph and sentence boundaries.
@@ -156,7 +161,7 @@ Provide a clear, concise summary."""
     ]
     
     try:
-        response = call_groq(
+        response = await acall_groq(
             client,
             messages=messages,
             model=model,
@@ -205,7 +210,7 @@ Provide a well-structured, comprehensive summary in professional academic langua
     ]
     
     try:
-        response = call_groq(
+        response = await acall_groq(
             client,
             messages=messages,
             model=model,
@@ -223,7 +228,7 @@ async def summarize_text_content(text_content: str, user_id: str) -> Tuple[str,
     Returns a tuple of (summary_text, error_message).
     """
     
-    client, error_message = get_groq_client()
+    client, error_message = get_async_groq_client()
 
     if error_message:
         return "", error_message
@@ -247,7 +252,7 @@ async def summarize_text_content(text_content: str, user_id: str) -> Tuple[str,
         for model in models:
             try:
                 # Quick test call
-                test_response = call_groq(
+                test_response = await acall_groq(
                     client,
                     messages=[{"role": "user", "content": "Hi"}],
                     model=model,
@@ -283,7 +288,7 @@ async def summarize_text_content(text_content: str, user_id: str) -> Tuple[str,
                 {"role": "user", "content": user_prompt}
             ]
             
-            response = call_groq(
+            response = await acall_groq(
                 client,
                 messages=messages,
                 model=working_model,
@@ -1,5 +1,7 @@
 from supabase import Client
+from postgrest.types import ReturnMethod
 from typing import Dict, Any, Optional
+import asyncio
 
 async def log_usage(supabase: Client, user_id: str, user_name: str, feature_name: str, action: str, metadata: Optional[Dict[str, Any]] = None):
     if user_id.startswith("guest_"):
@@ -10,13 +12,14 @@ async def log_usage(supabase: Client, user_id: str, user_name: str, feature_name
         metadata = {}
 
     try:
-        response = supabase.table("usage_log").insert({
+        # The Supabase client is synchronous; run the write in a thread so it doesn't block the event loop
+        response = await asyncio.to_thread(supabase.table("usage_log").insert({
             "user_id": user_id,
             "username": user_name,
             "feature_name": feature_name,
             "action": action,
             "metadata": metadata
-        }).execute()
+        }, returning=ReturnMethod.minimal).execute)
         return {"success": True, "data": response.data}
     except Exception as e:
         print(f"Error logging usage: {e}")
@@ -31,14 +34,15 @@ async def log_performance(supabase: Client, user_id: str, feature: str, score: f
         extra = {}
 
     try:
-        response = supabase.table("performance_log").insert({
+        # The Supabase client is synchronous; run the write in a thread so it doesn't block the event loop
+        response = await asyncio.to_thread(supabase.table("performance_log").insert({
             "user_id": user_id,
             "feature": feature,
             "score": score,
             "total_questions": total_questions,
             "correct_answers": correct_answers,
             "extra": extra
-        }).execute()
+        }, returning=ReturnMethod.minimal).execute)
         return {"success": True, "data": response.data}
     except Exception as e:
         print(f"Error logging performance: {e}")